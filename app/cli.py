@@ -0,0 +1,155 @@
+"""Maintenance commands for FastAPI-managed read models.
+
+Usage::
+
+    python -m app.cli rebuild-product-summary
+    python -m app.cli rebuild-sales-leaderboard
+    python -m app.cli rebuild-recommendations
+    python -m app.cli ensure-category-indexes
+    python -m app.cli explain-category-queries
+    python -m app.cli ensure-coupon-code-index
+
+Each command opens its own session and commits its work.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import func, select, text
+
+from app.database import AsyncSessionLocal, Base, engine
+from app.models import Product
+from app.repositories.products import ProductRepository
+from app.services.leaderboard import rebuild_leaderboard
+from app.services.recommendations import rebuild_recommendations
+
+
+async def rebuild_product_summary() -> None:
+    """Recompute every product_summary row (covers Django-side edits)."""
+    async with AsyncSessionLocal() as session:
+        changed = await ProductRepository.refresh_summaries(session)
+        await session.commit()
+    print(f"[cli] product_summary rebuilt ({changed} rows changed)")
+
+
+async def rebuild_sales_leaderboard() -> None:
+    """Recompute the most-sold counters from products_saledetail."""
+    async with AsyncSessionLocal() as session:
+        await rebuild_leaderboard(session)
+        await session.commit()
+    print("[cli] sales leaderboard rebuilt")
+
+
+async def rebuild_related_products() -> None:
+    """Recompute product_related from purchases and likes."""
+    async with AsyncSessionLocal() as session:
+        count = await rebuild_recommendations(session)
+        await session.commit()
+    print(f"[cli] product_related rebuilt ({count} products)")
+
+
+# column -> index created when the column has no index of its own yet
+CATEGORY_INDEXES = {
+    "type_id_id": "products_products_type_id_id_idx",
+    "tipo_juego_id": "products_products_tipo_juego_id_idx",
+}
+
+
+async def ensure_category_indexes() -> None:
+    """Index products_products.type_id_id / tipo_juego_id if not indexed yet.
+
+    Django normally indexes both ForeignKey columns already; this only fills
+    the gap on databases where they are missing. Indexes are built
+    CONCURRENTLY, so the table stays writable.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for column, index_name in CATEGORY_INDEXES.items():
+            existing = await conn.execute(
+                text(
+                    "SELECT c.relname FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid "
+                    "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+                    "WHERE i.indrelid = 'products_products'::regclass AND a.attname = :column"
+                ),
+                {"column": column},
+            )
+            found = existing.scalars().first()
+            if found:
+                print(f"[cli] {column}: already indexed by {found}")
+                continue
+            await conn.execute(
+                text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON products_products ({column})")
+            )
+            print(f"[cli] {column}: created {index_name}")
+
+
+async def explain_category_queries() -> None:
+    """Print the plans of the category page queries (by-type / by-game-type)."""
+    async with AsyncSessionLocal() as session:
+        for column in (Product.type_id_id, Product.tipo_juego_id):
+            value = (await session.execute(select(func.min(column)))).scalar()
+            if value is None:
+                print(f"[cli] {column.key}: no rows to explain")
+                continue
+            query = (
+                select(Product.id_product)
+                .where(column == value)
+                .order_by(Product.id_product)
+                .limit(20)
+            )
+            sql = query.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+            plan = [line for (line,) in (await session.execute(text(f"EXPLAIN {sql}"))).all()]
+            uses_index = any("Index Cond" in line and column.key in line for line in plan)
+            print(f"[cli] {column.key} = {value}: {'index scan' if uses_index else 'NO index scan'}")
+            for line in plan:
+                print(f"    {line}")
+
+
+COUPON_CODE_INDEX = "coupons_coupon_name_coupon_lower_idx"
+
+
+async def ensure_coupon_code_index() -> None:
+    """Index coupons_coupon on lower(name_coupon) for case-insensitive code lookups.
+
+    Built CONCURRENTLY, so the table stays writable.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {COUPON_CODE_INDEX} "
+                "ON coupons_coupon (lower(name_coupon))"
+            )
+        )
+    print(f"[cli] lower(name_coupon): {COUPON_CODE_INDEX} present")
+
+
+COMMANDS = {
+    "rebuild-product-summary": rebuild_product_summary,
+    "rebuild-sales-leaderboard": rebuild_sales_leaderboard,
+    "rebuild-recommendations": rebuild_related_products,
+    "ensure-category-indexes": ensure_category_indexes,
+    "explain-category-queries": explain_category_queries,
+    "ensure-coupon-code-index": ensure_coupon_code_index,
+}
+
+
+async def _run(command: str) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        await COMMANDS[command]()
+    finally:
+        await engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args(argv)
+    asyncio.run(_run(args.command))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,18 @@ from sqlalchemy.orm import sessionmaker, declarative_base
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# SQLAlchemy's compiled-statement cache (per engine) and asyncpg's
+# prepared-statement cache (per connection). Sparse fieldsets add one cached
+# statement per column set, hence the larger than default sizes.
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "500"))
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=True,
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    connect_args={"prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE},
+)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routers import auth
@@ -8,9 +9,14 @@ from .routers import order_buy
 from .routers import coupons
 from .routers import shopping_car
 from .routers import user_points
-from .database import Base, engine
+from .database import AsyncSessionLocal, Base, engine
+from .services.autocomplete import rebuild_autocomplete, start_autocomplete_refresher
+from .services.catalog_cache import start_summary_refresher
+from .services.leaderboard import bootstrap_leaderboard, start_leaderboard_maintenance
+from .services.search_index import refresh_title_index
+from .util.compression import CompressionMiddleware
 
-app = FastAPI(title="Reactive FastAPI Microservice")
+app = FastAPI(title="Reactive FastAPI Microservice", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,12 +24,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+app.add_middleware(CompressionMiddleware)
 
 @app.on_event("startup")
 async def on_startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as session:
+        await bootstrap_leaderboard(session)
+    async with AsyncSessionLocal() as session:
+        await refresh_title_index(session, force=True)
+        await rebuild_autocomplete(session)
+    start_autocomplete_refresher()
+    start_summary_refresher()
+    start_leaderboard_maintenance()
 
 
 @app.get("/health")
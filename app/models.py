@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Boolean, Table, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, Boolean, Table, DateTime, BigInteger, Float, Numeric
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 
 products_products_consola = Table(
     "products_products_consola", Base.metadata,
@@ -22,11 +22,49 @@ class Product(Base):
     puntos_venta = Column(Integer, default=0)
     puede_rentarse = Column(Boolean, default=True)
     destacado = Column(Boolean, default=False)
-    type_id_id = Column(String(50), default="")
-    tipo_juego_id = Column(String(50), default="")
+    # Django ForeignKey columns (integer ids of the type / game type tables)
+    type_id_id = Column(Integer, nullable=True)
+    tipo_juego_id = Column(Integer, nullable=True)
     consoles = relationship("Consoles", secondary=products_products_consola, back_populates="products", lazy="selectin")
 
 
+class ProductSummary(Base):
+    """Per-product pricing/stock read model (FastAPI-managed).
+
+    One row per product, maintained incrementally by the order stock hooks
+    and reconciled with edits made from the Django admin every
+    ``PRODUCT_SUMMARY_REFRESH_SECONDS`` (see ``services.catalog_cache``) or
+    on demand with ``python -m app.cli rebuild-product-summary``. No foreign key
+    is declared so that Django-side product deletes are never blocked.
+    """
+
+    __tablename__ = "product_summary"
+
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    min_price = Column(Integer, nullable=True)
+    min_discount_price = Column(Integer, nullable=True)
+    total_stock = Column(Integer, nullable=False, default=0)
+    in_stock = Column(Boolean, nullable=False, default=False)
+    variant_count = Column(Integer, nullable=False, default=0)
+    console_ids = Column(ARRAY(Integer), nullable=False, default=list)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+
+class CatalogChecksum(Base):
+    """Row checksum of a Django-edited catalog table (FastAPI-managed).
+
+    Recomputed with the ``product_summary`` reconcile (see
+    ``services.catalog_cache``); ``updated_at`` moves only when the checksum
+    changes, so catalog ETags can notice edits without scanning the table.
+    """
+
+    __tablename__ = "catalog_checksum"
+
+    table_name = Column(String(64), primary_key=True)
+    checksum = Column(Numeric, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+
 class GameDetail(Base):
     __tablename__ = "products_gamedetail"
 
@@ -189,6 +227,45 @@ class SaleDetail(Base):
     combinacion = relationship("GameDetail", backref="sale_details")
 
 
+class ProductSalesTotal(Base):
+    """All-time sales counter per product (FastAPI-managed leaderboard).
+
+    Incremented alongside each new SaleDetail and rebuilt from
+    ``products_saledetail`` with ``python -m app.cli rebuild-sales-leaderboard``.
+    """
+
+    __tablename__ = "product_sales_total"
+
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    sales = Column(Integer, nullable=False, default=0)
+
+
+class ProductSalesDaily(Base):
+    """Per-product, per-day (UTC) sales buckets backing rolling windows."""
+
+    __tablename__ = "product_sales_daily"
+
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Date, primary_key=True, index=True)
+    sales = Column(Integer, nullable=False, default=0)
+
+
+class ProductRelated(Base):
+    """Precomputed top-K related products (FastAPI-managed recommendations).
+
+    One row per product holding its nearest neighbours by co-purchase /
+    co-like cosine similarity, best first. Rebuilt offline with
+    ``python -m app.cli rebuild-recommendations``.
+    """
+
+    __tablename__ = "product_related"
+
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    related_ids = Column(ARRAY(Integer), nullable=False, default=list)
+    scores = Column(ARRAY(Float), nullable=False, default=list)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+
 class ShoppingCar(Base):
     __tablename__ = "products_shoppingcar"
 
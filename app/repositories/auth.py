@@ -1,16 +1,37 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models import User, UserCustomized
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import selectinload
+from app.models import LikedGame, User, UserCustomized
 from app.util.util_auth import get_password_hash
 
+# Prebuilt statements for the per-request auth lookups: built (and their
+# cache key generated) once, executed with bound values.
+_USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+_USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+_PROFILE_BY_USER_ID = select(UserCustomized).where(UserCustomized.user_id == bindparam("user_id"))
+_LIKED_GAMES_BY_USER_ID = (
+    select(LikedGame)
+    .options(selectinload(LikedGame.product))
+    .where(LikedGame.user_id == bindparam("user_id"))
+)
+
 async def get_user_by_username(session: AsyncSession, username: str):
-    result = await session.execute(select(User).filter(User.username == username))
+    result = await session.execute(_USER_BY_USERNAME, {"username": username})
     return result.scalars().first()
 
 async def get_user_by_email(session: AsyncSession, email: str):
-    result = await session.execute(select(User).filter(User.email == email))
+    result = await session.execute(_USER_BY_EMAIL, {"email": email})
+    return result.scalars().first()
+
+async def get_profile(session: AsyncSession, user_id: int) -> UserCustomized | None:
+    result = await session.execute(_PROFILE_BY_USER_ID, {"user_id": user_id})
     return result.scalars().first()
 
+async def get_liked_games(session: AsyncSession, user_id: int) -> list[LikedGame]:
+    """The user's liked games with their ``product`` loaded."""
+    result = await session.execute(_LIKED_GAMES_BY_USER_ID, {"user_id": user_id})
+    return result.scalars().all()
+
 async def create_user(
     session: AsyncSession,
     username: str,
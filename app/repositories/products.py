@@ -1,6 +1,118 @@
+from dataclasses import dataclass
+from datetime import date
+
+from sqlalchemy import Integer, and_, bindparam, delete, exists, func, literal_column, or_, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from ..models import Product
+from ..models import Product, GameDetail, ProductSummary, products_products_consola
+
+
+@dataclass(frozen=True)
+class PriceSummary:
+    """Aggregated pricing/stock figures for a single product.
+
+    ``min_price`` only considers variants with stock > 0 and precio > 0;
+    ``min_discount_price`` only variants with stock > 0 and
+    precio_descuento > 0 (None when there is no active discount).
+    """
+
+    min_price: int | None = None
+    min_discount_price: int | None = None
+    total_stock: int = 0
+    variant_count: int = 0
+    console_ids: tuple[int, ...] = ()
+
+    @property
+    def in_stock(self) -> bool:
+        return self.total_stock > 0
+
+
+EMPTY_PRICE_SUMMARY = PriceSummary()
+
+
+def _summary_source(product_ids: list[int] | None = None):
+    """SELECT computing product_summary columns live from GameDetail/consoles."""
+    in_stock = GameDetail.stock > 0
+    prices = (
+        select(
+            GameDetail.producto_id.label("product_id"),
+            func.min(GameDetail.precio).filter(and_(in_stock, GameDetail.precio > 0)).label("min_price"),
+            func.min(GameDetail.precio_descuento).filter(and_(in_stock, GameDetail.precio_descuento > 0)).label("min_discount_price"),
+            func.sum(GameDetail.stock).filter(in_stock).label("total_stock"),
+            func.count(GameDetail.id_game_detail).label("variant_count"),
+        )
+        .group_by(GameDetail.producto_id)
+    )
+    consoles = (
+        select(
+            products_products_consola.c.products_id.label("product_id"),
+            func.array_agg(
+                aggregate_order_by(products_products_consola.c.consoles_id, products_products_consola.c.consoles_id)
+            ).label("console_ids"),
+        )
+        .group_by(products_products_consola.c.products_id)
+    )
+    if product_ids is not None:
+        prices = prices.where(GameDetail.producto_id.in_(product_ids))
+        consoles = consoles.where(products_products_consola.c.products_id.in_(product_ids))
+    prices = prices.subquery()
+    consoles = consoles.subquery()
+
+    total_stock = func.coalesce(prices.c.total_stock, 0)
+    query = (
+        select(
+            Product.id_product.label("product_id"),
+            prices.c.min_price,
+            prices.c.min_discount_price,
+            total_stock.label("total_stock"),
+            (total_stock > 0).label("in_stock"),
+            func.coalesce(prices.c.variant_count, 0).label("variant_count"),
+            func.coalesce(consoles.c.console_ids, literal_column("'{}'::integer[]")).label("console_ids"),
+            func.now().label("updated_at"),
+        )
+        .outerjoin(prices, prices.c.product_id == Product.id_product)
+        .outerjoin(consoles, consoles.c.product_id == Product.id_product)
+    )
+    if product_ids is not None:
+        query = query.where(Product.id_product.in_(product_ids))
+    return query
+
+
+# Prebuilt hot-path statement: its cache key is generated once, per request
+# only the bound ids change.
+_SUMMARIES_BY_IDS = select(
+    ProductSummary.product_id,
+    ProductSummary.min_price,
+    ProductSummary.min_discount_price,
+    ProductSummary.total_stock,
+    ProductSummary.variant_count,
+    ProductSummary.console_ids,
+).where(ProductSummary.product_id.in_(bindparam("product_ids", expanding=True)))
+
+
+_SUMMARY_COLUMNS = (
+    "product_id",
+    "min_price",
+    "min_discount_price",
+    "total_stock",
+    "in_stock",
+    "variant_count",
+    "console_ids",
+    "updated_at",
+)
+# columns compared to decide whether a summary row changed
+_SUMMARY_VALUES = _SUMMARY_COLUMNS[1:-1]
+
+# pg advisory lock namespace (two-key form; the second key is the product id):
+# one transaction at a time refreshes a given product's summary.
+_SUMMARY_ROW_LOCK = 0x7073
+_LOCK_SUMMARY_ROW = select(
+    func.pg_advisory_xact_lock(
+        literal_column(str(_SUMMARY_ROW_LOCK)), bindparam("product_id", type_=Integer)
+    )
+)
+
 
 class ProductRepository:
 
@@ -16,3 +128,123 @@ class ProductRepository:
         await session.commit()
         await session.refresh(product)
         return product
+
+    @staticmethod
+    async def get_price_summaries(
+        session: AsyncSession, product_ids: list[int]
+    ) -> dict[int, PriceSummary]:
+        """Return product_id -> PriceSummary.
+
+        Reads the ``product_summary`` read model (primary-key lookups). Ids
+        without a summary row yet (e.g. products just created from Django) are
+        computed live with a single aggregate query. Every requested id is
+        present in the result; unknown products map to ``EMPTY_PRICE_SUMMARY``.
+        """
+        if not product_ids:
+            return {}
+
+        summaries = dict.fromkeys(product_ids, EMPTY_PRICE_SUMMARY)
+        result = await session.execute(_SUMMARIES_BY_IDS, {"product_ids": list(summaries)})
+        rows = result.all()
+        found = {row.product_id for row in rows}
+        missing = [pid for pid in summaries if pid not in found]
+        if missing:
+            live = await session.execute(_summary_source(missing))
+            rows += live.all()
+
+        for row in rows:
+            summaries[row.product_id] = PriceSummary(
+                min_price=row.min_price,
+                min_discount_price=row.min_discount_price,
+                total_stock=int(row.total_stock or 0),
+                variant_count=int(row.variant_count or 0),
+                console_ids=tuple(row.console_ids or ()),
+            )
+        return summaries
+
+    @staticmethod
+    async def refresh_summaries(
+        session: AsyncSession, product_ids: list[int] | None = None
+    ) -> int:
+        """Recompute ``product_summary`` rows from GameDetail and consoles.
+
+        With ``product_ids`` only those products are upserted; this runs
+        inside the caller's transaction (pending changes are autoflushed
+        first) and does NOT commit. A per-product advisory lock, held until
+        the caller's transaction ends, makes concurrent refreshes of the same
+        product aggregate one after the other, so an order whose snapshot
+        misses another order's stock change cannot overwrite its summary.
+
+        Without ids every product is reconciled as a diff: only rows whose
+        values differ are updated, missing rows are inserted and rows of
+        products that no longer exist are removed, so unchanged rows are
+        never locked. Returns the number of rows inserted, updated or
+        deleted.
+        """
+        if product_ids is not None and not product_ids:
+            return 0
+
+        if product_ids is not None:
+            for product_id in sorted(set(product_ids)):
+                await session.execute(_LOCK_SUMMARY_ROW, {"product_id": product_id})
+            stmt = pg_insert(ProductSummary).from_select(
+                _SUMMARY_COLUMNS, _summary_source(product_ids)
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ProductSummary.product_id],
+                set_={name: stmt.excluded[name] for name in _SUMMARY_COLUMNS[1:]},
+                where=or_(*(
+                    getattr(ProductSummary, name).is_distinct_from(stmt.excluded[name])
+                    for name in _SUMMARY_VALUES
+                )),
+            )
+            return (await session.execute(stmt)).rowcount
+
+        summaries = ProductSummary.__table__
+        source = _summary_source().subquery()
+        updated = await session.execute(
+            update(summaries)
+            .where(
+                summaries.c.product_id == source.c.product_id,
+                or_(*(summaries.c[name].is_distinct_from(source.c[name]) for name in _SUMMARY_VALUES)),
+            )
+            .values({name: source.c[name] for name in _SUMMARY_COLUMNS[1:]})
+        )
+        inserted = await session.execute(
+            pg_insert(ProductSummary)
+            .from_select(
+                _SUMMARY_COLUMNS,
+                select(source).where(
+                    ~exists().where(summaries.c.product_id == source.c.product_id)
+                ),
+            )
+            .on_conflict_do_nothing(index_elements=[ProductSummary.product_id])
+        )
+        deleted = await session.execute(
+            delete(summaries).where(summaries.c.product_id.not_in(select(Product.id_product)))
+        )
+        return updated.rowcount + inserted.rowcount + deleted.rowcount
+
+    @staticmethod
+    def export_query(since: date | None = None):
+        """SELECT of every product's public columns plus live prices/consoles.
+
+        Meant to be streamed (``session.stream``); ``since`` keeps only
+        products whose ``date_last_modified`` is on or after that day.
+        """
+        query = _summary_source().add_columns(
+            Product.title,
+            Product.description,
+            Product.date_register,
+            Product.date_last_modified,
+            Product.image,
+            Product.calification,
+            Product.puntos_venta,
+            Product.puede_rentarse,
+            Product.destacado,
+            Product.type_id_id,
+            Product.tipo_juego_id,
+        )
+        if since is not None:
+            query = query.where(Product.date_last_modified >= since)
+        return query.order_by(Product.id_product)
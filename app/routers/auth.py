@@ -3,10 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr, constr, json
-from sqlalchemy.orm import selectinload
-from sqlalchemy import select 
 from app.database import get_session
-from app.models import LikedGame, Product, User, UserCustomized
+from app.models import Product, User, UserCustomized
 from app.util.util_auth import (
     verify_password,
     create_access_token,
@@ -114,13 +112,7 @@ async def login(
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    query = (
-        select(LikedGame)
-        .options(selectinload(LikedGame.product))
-        .where(LikedGame.user_id == user.id)
-    )
-    result = await session.execute(query)
-    liked_games = result.scalars().all()
+    liked_games = await auth_repo.get_liked_games(session, user.id)
 
     liked_data = [
         LikedProduct(
@@ -158,13 +150,7 @@ async def refresh_token(
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    query = (
-        select(LikedGame)
-        .options(selectinload(LikedGame.product))
-        .where(LikedGame.user_id == current_user.id)
-    )
-    result = await session.execute(query)
-    liked_games = result.scalars().all()
+    liked_games = await auth_repo.get_liked_games(session, current_user.id)
 
     liked_ids = [
         lg.product.id_product
@@ -249,10 +235,7 @@ async def update_profile(
         user.email = payload.email
 
         # Upsert customized profile for phone_number (always set on full update)
-        result = await session.execute(
-            select(UserCustomized).where(UserCustomized.user_id == user.id)
-        )
-        profile = result.scalars().first()
+        profile = await auth_repo.get_profile(session, user.id)
         if profile is None:
             profile = UserCustomized(
                 user_id=user.id,
@@ -269,10 +252,7 @@ async def update_profile(
         await session.refresh(user)
 
         # Re-read profile for response
-        result = await session.execute(
-            select(UserCustomized).where(UserCustomized.user_id == user.id)
-        )
-        profile = result.scalars().first()
+        profile = await auth_repo.get_profile(session, user.id)
 
         return {
             "id": user.id,
@@ -307,10 +287,7 @@ async def patch_profile(
 
     # Upsert customized profile for phone_number
     if payload.phone_number is not None and payload.phone_number != "":
-        result = await session.execute(
-            select(UserCustomized).where(UserCustomized.user_id == user.id)
-        )
-        profile = result.scalars().first()
+        profile = await auth_repo.get_profile(session, user.id)
         if profile is None:
             profile = UserCustomized(
                 user_id=user.id,
@@ -323,10 +300,7 @@ async def patch_profile(
             profile.phone_number = payload.phone_number or ""
     else:
         # Still need profile object for response even if not modified
-        result = await session.execute(
-            select(UserCustomized).where(UserCustomized.user_id == user.id)
-        )
-        profile = result.scalars().first()
+        profile = await auth_repo.get_profile(session, user.id)
 
     # Optionally update email if provided and non-empty
     if payload.email is not None and payload.email != "" and payload.email != user.email:
@@ -340,10 +314,7 @@ async def patch_profile(
     await session.refresh(user)
 
     # Re-read profile (in case it was created above)
-    result = await session.execute(
-        select(UserCustomized).where(UserCustomized.user_id == user.id)
-    )
-    profile = result.scalars().first()
+    profile = await auth_repo.get_profile(session, user.id)
 
     return {
         "id": user.id,
@@ -368,10 +339,7 @@ async def exchange_points(
     """
 
     # Load or create the customized profile to access puntos
-    result = await session.execute(
-        select(UserCustomized).where(UserCustomized.user_id == current_user.id)
-    )
-    profile = result.scalars().first()
+    profile = await auth_repo.get_profile(session, current_user.id)
 
     if profile is None or profile.puntos < 2000:
         raise HTTPException(
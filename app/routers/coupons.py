@@ -12,9 +12,9 @@ def _serialize_coupon(c: Coupon) -> dict:
     return {
         "id_coupon": c.id_coupon,
         "name_coupon": c.name_coupon,
-        "created_at": c.created_at.isoformat() if c.created_at else None,
-        "modified_at": c.modified_at.isoformat() if c.modified_at else None,
-        "expiration_date": c.expiration_date.isoformat() if c.expiration_date else None,
+        "created_at": c.created_at,
+        "modified_at": c.modified_at,
+        "expiration_date": c.expiration_date,
         "is_valid": c.is_valid,
         "user_id": c.user_id,
         "percentage_off": c.percentage_off,
@@ -1,7 +1,7 @@
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File, Form, status
+from sqlalchemy import bindparam, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
@@ -9,6 +9,7 @@ from app.database import get_session
 from app.models import Product, User, OrderBuy
 from app.repositories.order_buy import OrderBuyRepository
 from app.services.order_buy import on_order_created, on_status_transition
+from app.util.pagination import decode_cursor, encode_cursor
 from app.util.util_auth import get_current_user
 from app.util.supabase_storage import upload_invoice_file, SupabaseNotConfiguredError
 
@@ -48,15 +49,40 @@ class OrderBuyPatch(BaseModel):
     description_order: str | None = None
 
 
+# Prebuilt order listings (SQLAlchemy cache key generated once); requests
+# only supply the bound values.
+_ORDERS_WITH_PRODUCT = select(OrderBuy, Product).join(
+    Product, OrderBuy.product_id == Product.id_product
+)
+_ADMIN_PAGE = (
+    _ORDERS_WITH_PRODUCT.order_by(OrderBuy.id_order.desc())
+    .offset(bindparam("offset"))
+    .limit(bindparam("limit"))
+)
+_ADMIN_PAGE_AFTER = (
+    _ORDERS_WITH_PRODUCT.where(OrderBuy.id_order < bindparam("last_id"))
+    .order_by(OrderBuy.id_order.desc())
+    .limit(bindparam("limit"))
+)
+_ORDERS_BY_USER_ID = _ORDERS_WITH_PRODUCT.where(OrderBuy.user_id == bindparam("user_id"))
+_ORDER_BY_ID = _ORDERS_WITH_PRODUCT.where(OrderBuy.id_order == bindparam("order_id"))
+
+
 @router.get("/admin", response_model=list[OrderBuyRead])
 async def list_all_orders_paginated(
+    response: Response,
     page: int = 1,
+    cursor: str | None = None,
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ):
     """Return all orders, 20 per page, only for superusers.
 
     Uses JWT session token via get_current_user and checks current_user.is_superuser.
+
+    Pages can be requested by number (``page``) or, for constant-cost deep
+    paging, by ``cursor``: the value of the ``X-Next-Cursor`` response header
+    of the previous page (absent on the last page).
     """
 
     if not bool(getattr(current_user, "is_superuser", False)):
@@ -66,18 +92,21 @@ async def list_all_orders_paginated(
         )
 
     page_size = 20
-    if page < 1:
-        page = 1
-    offset = (page - 1) * page_size
-
-    result = await session.execute(
-        select(OrderBuy, Product)
-        .join(Product, OrderBuy.product_id == Product.id_product)
-        .order_by(OrderBuy.id_order.desc())
-        .offset(offset)
-        .limit(page_size)
-    )
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        result = await session.execute(
+            _ADMIN_PAGE_AFTER, {"last_id": last_id, "limit": page_size + 1}
+        )
+    else:
+        if page < 1:
+            page = 1
+        result = await session.execute(
+            _ADMIN_PAGE, {"offset": (page - 1) * page_size, "limit": page_size + 1}
+        )
     rows = result.all()
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1][0].id_order)
 
     return [
         {
@@ -103,11 +132,7 @@ async def list_orders(
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ):
-    result = await session.execute(
-        select(OrderBuy, Product)
-        .join(Product, OrderBuy.product_id == Product.id_product)
-        .where(OrderBuy.user_id == current_user.id)
-    )
+    result = await session.execute(_ORDERS_BY_USER_ID, {"user_id": current_user.id})
     rows = result.all()
 
     return [
@@ -131,11 +156,7 @@ async def list_orders(
 
 @router.get("/{order_id}", response_model=OrderBuyRead)
 async def get_order(order_id: int, session: AsyncSession = Depends(get_session)):
-    result = await session.execute(
-        select(OrderBuy, Product)
-        .join(Product, OrderBuy.product_id == Product.id_product)
-        .where(OrderBuy.id_order == order_id)
-    )
+    result = await session.execute(_ORDER_BY_ID, {"order_id": order_id})
     row = result.first()
     if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
@@ -1,14 +1,20 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime, date, timedelta, timezone
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, conlist
 import asyncio
-from sqlalchemy import select, func, or_, cast, Integer, literal
-from sqlalchemy.orm import selectinload
+import orjson
+import os
+from sqlalchemy import Select, bindparam, select, func, or_, and_, distinct, literal
 
-from ..database import get_session
+from ..database import AsyncSessionLocal, get_session
+from ..repositories.products import ProductRepository
 from ..models import (
     Product,
     GameDetail,
@@ -17,46 +23,211 @@ from ..models import (
     Coupon,
     CouponGameDetail,
     User,
-    SaleDetail,
-    CouponRule,
-    CouponRedemption,
+    products_products_consola,
 )
+from ..services.autocomplete import AUTOCOMPLETE_TOP_N, autocomplete
+from ..services.catalog_cache import get_catalog_snapshot, get_catalog_version
+from ..services.coupon_directory import CouponEntry, lookup_coupon
+from ..services.coupon_rules import cart_context, get_rule_plan
+from ..services.events import stock_events
+from ..services.leaderboard import get_ranking
+from ..services.recommendations import get_related_ids
+from ..services.week_offers import get_week_offers_feed
+from ..services.search_index import (
+    SEARCH_FUZZY_MIN_RESULTS,
+    refresh_title_index,
+    search_product_ids,
+)
+from ..util.compression import (
+    COMPRESSION_MINIMUM_SIZE,
+    enable_compression,
+    negotiate_encoding,
+    weaken_etag,
+)
+from ..util.http_cache import make_etag, raise_if_not_modified
+from ..util.pagination import decode_cursor, encode_cursor
+from ..util.search_text import normalize_search_text
 from ..util.util_auth import get_current_user
 
 router = APIRouter(prefix="/products", tags=["products"])
 
-ALIAS_MAP = {
-    'fifa': ['fc'],
-    'cod': ['callofduty', 'callofdutyblackops', 'callofdutymw', 'callofdutywarzone'],
-    'pes': ['proevolutionsoccer', 'efootball'],
-    'hades2': ['hadesii', 'hadestwo', 'hades ii', 'hades two'],
-    'rdr2': ['reddeadredemption2', 'reddead', 'redemption', 'rdrii', 'reddeadredemptionii', 'reddeadredemption', 'reddead2'],
-    'reddead': ['reddeadredemption2', 'rdr2', 'redemption', 'rdrii', 'reddeadredemptionii', 'reddeadredemption', 'reddead2'],
-    'redemption': ['reddeadredemption2', 'rdr2', 'reddead', 'rdrii', 'reddeadredemptionii', 'reddeadredemption', 'reddead2'],
-    'rdrii': ['reddeadredemption2', 'rdr2', 'reddead', 'redemption', 'reddeadredemptionii', 'reddeadredemption', 'reddead2'],
-    'reddeadredemptionii': ['reddeadredemption2', 'rdr2', 'reddead', 'redemption', 'rdrii', 'reddeadredemption', 'reddead2'],
-    'reddeadredemption2': ['rdr2', 'reddead', 'redemption', 'rdrii', 'reddeadredemptionii', 'reddeadredemption', 'reddead2'],
-    'reddeadredemption': ['reddeadredemption2', 'rdr2', 'reddead', 'redemption', 'rdrii', 'reddeadredemptionii', 'reddead2'],
-    'reddead2': ['reddeadredemption2', 'rdr2', 'reddead', 'redemption', 'rdrii', 'reddeadredemptionii', 'reddeadredemption'],
-    'fc26': ['fc 26 Standard'],
-    'fifa26': ['fc 26 Standard'],
-    'fifa 26': ['fc 26 Standard'],
-    'fc 26': ['FC 26 Standard'],
-    'grandtheftautoiv': ['gta iv', 'gta 4'],
-    'gtaiv': ['grand theft auto iv', 'gta 4'],
-    'gta4': ['grand theft auto iv', 'gta iv'],
-    'gta6': ['grand theft auto vi', 'gta vi', 'gtavi'],
-    'gtavi': ['grand theft auto vi', 'gta 6', 'gta6'],
-    'grandtheftautovi': ['gta 6', 'gta6', 'gta vi', 'gtavi'],
-    'helldiversii': ['helldivers 2'],
-    'helldivers2': ['helldivers ii'],
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+COMBINATION_PRICE_BATCH_MAX = int(os.getenv("COMBINATION_PRICE_BATCH_MAX", "300"))
+PRODUCT_BATCH_MAX = int(os.getenv("PRODUCT_BATCH_MAX", "300"))
+
+
+async def _catalog_etag(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+) -> str:
+    """Answer 304 when If-None-Match matches the current catalog ETag.
+
+    Runs before the endpoint body, so unchanged polls skip the listing
+    queries and serialization. Otherwise the ETag is attached to the response.
+    """
+    etag = make_etag(await get_catalog_version(session), request)
+    raise_if_not_modified(request, etag)
+    response.headers.update(_etag_headers(etag))
+    return etag
+
+
+def _etag_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+# Public field name -> Product column (``type_id`` is the older name of ``type_id_id``
+# still used by some endpoints).
+PRODUCT_COLUMN_FIELDS = {
+    "id_product": Product.id_product,
+    "title": Product.title,
+    "description": Product.description,
+    "date_register": Product.date_register,
+    "date_last_modified": Product.date_last_modified,
+    "image": Product.image,
+    "calification": Product.calification,
+    "puntos_venta": Product.puntos_venta,
+    "puede_rentarse": Product.puede_rentarse,
+    "destacado": Product.destacado,
+    "type_id_id": Product.type_id_id,
+    "type_id": Product.type_id_id,
+    "tipo_juego_id": Product.tipo_juego_id,
+}
+
+# Public field name -> value read from the product's PriceSummary.
+PRODUCT_SUMMARY_FIELDS = {
+    "price": lambda summary: summary.min_price,
+    "price_discount": lambda summary: summary.min_discount_price,
+    "precio_descuento": lambda summary: summary.min_discount_price,
+    "stock": lambda summary: summary.total_stock,
+    "consoles": lambda summary: [{"id_console": console_id} for console_id in summary.console_ids],
 }
 
 
-def _normalize_search_text(value: str) -> str:
-    from unidecode import unidecode
+class ProductProjection:
+    """The set of fields a product endpoint returns.
+
+    Selects only the Product columns those fields need (``id_product`` is
+    always loaded), tells whether price summaries are needed at all and
+    serializes rows in field order. Endpoint specific values (e.g.
+    ``sales_count``) are passed to ``serialize`` as keyword arguments.
+    """
+
+    def __init__(self, fields: tuple[str, ...]) -> None:
+        self.fields = fields
+        self.columns = list(dict.fromkeys(
+            [Product.id_product]
+            + [PRODUCT_COLUMN_FIELDS[name] for name in fields if name in PRODUCT_COLUMN_FIELDS]
+        ))
+        self.needs_summary = any(name in PRODUCT_SUMMARY_FIELDS for name in fields)
+
+    def select(self, *extra_columns):
+        """``SELECT`` of the projected columns (plus ``extra_columns``)."""
+        return select(*dict.fromkeys([*self.columns, *extra_columns]))
+
+    def by_id(self):
+        """Prebuilt ``SELECT`` of one product, bound as ``id_product``."""
+        return _select_by_id(tuple(self.columns))
+
+    def by_ids(self):
+        """Prebuilt ``SELECT`` of several products, bound as ``product_ids``."""
+        return _select_by_ids(tuple(self.columns))
+
+    async def summaries(self, session: AsyncSession, product_ids: list[int]) -> dict:
+        if not self.needs_summary:
+            return {}
+        return await ProductRepository.get_price_summaries(session, product_ids)
+
+    def serialize(self, row, summary=None, **extra) -> dict:
+        data = {}
+        for name in self.fields:
+            if name in PRODUCT_COLUMN_FIELDS:
+                data[name] = getattr(row, PRODUCT_COLUMN_FIELDS[name].key)
+            elif name in PRODUCT_SUMMARY_FIELDS:
+                data[name] = PRODUCT_SUMMARY_FIELDS[name](summary)
+            else:
+                data[name] = extra[name]
+        return data
+
+
+# Statements are built once per column set so their SQLAlchemy cache key is
+# computed once too; only the bound values change between requests.
+@lru_cache(maxsize=256)
+def _select_by_id(columns: tuple) -> Select:
+    return select(*columns).where(Product.id_product == bindparam("id_product"))
+
+
+@lru_cache(maxsize=256)
+def _select_by_ids(columns: tuple) -> Select:
+    return select(*columns).where(
+        Product.id_product.in_(bindparam("product_ids", expanding=True))
+    )
+
+
+def _projection(
+    fields: str | None, default: tuple[str, ...], extra: tuple[str, ...] = ()
+) -> ProductProjection:
+    """Projection for a ``fields=`` query param (comma separated), or ``default``."""
+    if not fields:
+        return ProductProjection(default)
+    requested = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    allowed = {*PRODUCT_COLUMN_FIELDS, *PRODUCT_SUMMARY_FIELDS, *extra}
+    unknown = [name for name in requested if name not in allowed]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown) or '(none)'}. Allowed: {', '.join(sorted(allowed))}.",
+        )
+    return ProductProjection(requested)
+
+
+# Keys of the catalog snapshot rows (see services.catalog_cache).
+_CATALOG_FIELDS = (
+    "id_product", "title", "description", "date_register", "date_last_modified",
+    "image", "calification", "puntos_venta", "puede_rentarse", "destacado",
+    "type_id", "price", "price_discount", "consoles",
+)
+_LISTING_FIELDS = (
+    "id_product", "title", "description", "date_register", "date_last_modified",
+    "image", "calification", "puntos_venta", "puede_rentarse", "destacado",
+    "type_id_id", "tipo_juego_id", "price", "price_discount", "consoles",
+)
+_FAVORITES_FIELDS = (
+    "id_product", "title", "description", "date_register", "date_last_modified",
+    "image", "calification", "puntos_venta", "puede_rentarse", "destacado",
+    "price", "price_discount", "consoles",
+)
+_BY_TYPE_FIELDS = (
+    "id_product", "title", "description", "date_register", "date_last_modified",
+    "image", "calification", "puntos_venta", "puede_rentarse", "destacado",
+    "consoles",
+)
+_BY_CATEGORY_FIELDS = (
+    "id_product", "title", "description", "date_register", "date_last_modified",
+    "image", "calification", "puntos_venta", "puede_rentarse", "destacado",
+    "type_id", "consoles",
+)
+_SEARCH_FIELDS = (
+    "id_product", "title", "description", "date_register", "image",
+    "calification", "puntos_venta", "type_id", "price", "price_discount", "consoles",
+)
+_MOST_SOLD_FIELDS = (
+    "id_product", "title", "description", "date_register", "date_last_modified",
+    "image", "calification", "puntos_venta", "puede_rentarse", "destacado",
+    "type_id_id", "tipo_juego_id", "price", "price_discount", "sales_count", "consoles",
+)
+_DETAIL_FIELDS = (
+    "id_product", "title", "description", "date_register", "date_last_modified",
+    "image", "calification", "puntos_venta", "puede_rentarse", "destacado",
+    "stock", "precio_descuento", "price", "consoles",
+)
+
+_FIELDS_QUERY = Query(
+    default=None,
+    description="Comma separated fields to return, e.g. id_product,title,image,price",
+)
 
-    return unidecode(value).lower().replace(' ', '')
 
 class CartItem(BaseModel):
     """Single item in the cart used for coupon validation."""
@@ -96,109 +267,79 @@ class ValidateCouponResponse(BaseModel):
     discounted_items: list[DiscountedItem] = []
 
 
-async def _get_min_prices_for_products(session: AsyncSession, product_ids: list[int]) -> dict[int, float | None]:
-    """Return a mapping product_id -> minimum base price (precio > 0).
-
-    Only rows with stock > 0 and precio > 0 are considered.
-    Use _get_min_discount_prices_for_products for the discounted price.
-    """
-    if not product_ids:
-        return {}
-
-    result = await session.execute(
-        select(GameDetail.producto_id, func.min(GameDetail.precio))
-        .where(
-            GameDetail.producto_id.in_(product_ids),
-            GameDetail.stock > 0,
-            GameDetail.precio > 0,
-        )
-        .group_by(GameDetail.producto_id)
+# Game details linked to a coupon (M2M) with their combination; a linked id
+# whose GameDetail no longer exists still makes the coupon restricted.
+_COUPON_ALLOWED_COMBINATIONS = (
+    select(
+        GameDetail.id_game_detail,
+        GameDetail.licencia_id,
+        GameDetail.consola_id,
+        GameDetail.duracion_dias_alquiler,
     )
-
-    rows = result.all()
-    return {producto_id: min_price for producto_id, min_price in rows}
+    .select_from(CouponGameDetail)
+    .outerjoin(GameDetail, GameDetail.id_game_detail == CouponGameDetail.gamedetail_id)
+    .where(CouponGameDetail.coupon_id == bindparam("coupon_id"))
+)
+_GAME_DETAIL_COMBINATIONS = select(
+    GameDetail.id_game_detail,
+    GameDetail.licencia_id,
+    GameDetail.consola_id,
+    GameDetail.duracion_dias_alquiler,
+).where(GameDetail.id_game_detail.in_(bindparam("game_detail_ids", expanding=True)))
 
 
-async def _get_min_discount_prices_for_products(
-    session: AsyncSession, product_ids: list[int]
-) -> dict[int, float | None]:
-    """Return a mapping product_id -> minimum precio_descuento (>0).
+@dataclass(frozen=True)
+class CouponRestrictions:
+    """A coupon's game-detail restriction resolved for a set of game details.
 
-    Only rows with stock > 0 and precio_descuento > 0 are considered.
-    Returns None for products with no active discount variant.
+    ``restricted`` tells whether the coupon is linked to any GameDetail;
+    ``applies`` maps every requested game detail id to whether the coupon
+    covers it (always True for unrestricted coupons).
     """
-    if not product_ids:
-        return {}
 
-    result = await session.execute(
-        select(GameDetail.producto_id, func.min(GameDetail.precio_descuento))
-        .where(
-            GameDetail.producto_id.in_(product_ids),
-            GameDetail.stock > 0,
-            GameDetail.precio_descuento > 0,
-        )
-        .group_by(GameDetail.producto_id)
-    )
-    rows = result.all()
-    return {producto_id: min_discount for producto_id, min_discount in rows}
+    restricted: bool
+    applies: dict[int, bool]
 
 
-async def _product_matches_coupon_restrictions(
+async def _match_coupon_restrictions(
     session: AsyncSession,
     coupon_id: int,
-    game_detail_id: int,
-) -> bool:
-    """Check if a specific game detail (product) matches the coupon's allowed combinations.
-
-    Returns True if:
-    - Coupon has no game detail restrictions (empty set → applies to all), OR
-    - The game detail's (licencia_id, consola_id, duracion_dias_alquiler) tuple
-      matches one of the allowed combinations for this coupon.
-
-    Returns False if:
-    - Coupon has restrictions but the game detail is not in the allowed set.
+    game_detail_ids,
+) -> CouponRestrictions:
+    """Resolve which game details match the coupon's allowed combinations.
+
+    A game detail matches when the coupon has no game detail restrictions
+    (empty set → applies to all), or when its (licencia_id, consola_id,
+    duracion_dias_alquiler) tuple is one of the combinations of the game
+    details linked to the coupon. Unknown game details never match.
+
+    Costs two queries whatever the number of ids: the coupon's allowed
+    combinations, then (only for restricted coupons) the combinations of
+    all the requested game details at once.
     """
-    # Fetch all game detail IDs linked to this coupon via M2M
-    res_gd = await session.execute(
-        select(CouponGameDetail.gamedetail_id)
-        .where(CouponGameDetail.coupon_id == coupon_id)
-    )
-    coupon_game_detail_ids = {row[0] for row in res_gd.all()}
+    game_detail_ids = list(dict.fromkeys(gid for gid in game_detail_ids if gid is not None))
 
-    # If coupon has no restrictions, it applies to all products
-    if not coupon_game_detail_ids:
-        return True
+    res_allowed = await session.execute(_COUPON_ALLOWED_COMBINATIONS, {"coupon_id": coupon_id})
+    rows = res_allowed.all()
+    if not rows:
+        return CouponRestrictions(restricted=False, applies=dict.fromkeys(game_detail_ids, True))
 
-    # Build set of allowed (licencia_id, consola_id, duracion_dias_alquiler) combinations
-    res_allowed = await session.execute(
-        select(
-            GameDetail.licencia_id,
-            GameDetail.consola_id,
-            GameDetail.duracion_dias_alquiler,
-        ).where(GameDetail.id_game_detail.in_(coupon_game_detail_ids))
-    )
     allowed_combinations = {
         (row.licencia_id, row.consola_id, row.duracion_dias_alquiler)
-        for row in res_allowed.all()
+        for row in rows
+        if row.id_game_detail is not None
     }
-
-    # Fetch the combination for the given game detail
-    res_item = await session.execute(
-        select(
-            GameDetail.licencia_id,
-            GameDetail.consola_id,
-            GameDetail.duracion_dias_alquiler,
-        ).where(GameDetail.id_game_detail == game_detail_id)
-    )
-    item_row = res_item.first()
-
-    # If game detail not found, no match
-    if item_row is None:
-        return False
-
-    # Check if item's combination is in allowed set
-    item_combination = (item_row.licencia_id, item_row.consola_id, item_row.duracion_dias_alquiler)
-    return item_combination in allowed_combinations
+    applies = dict.fromkeys(game_detail_ids, False)
+    if game_detail_ids and allowed_combinations:
+        res_items = await session.execute(
+            _GAME_DETAIL_COMBINATIONS, {"game_detail_ids": game_detail_ids}
+        )
+        for row in res_items.all():
+            applies[row.id_game_detail] = (
+                (row.licencia_id, row.consola_id, row.duracion_dias_alquiler)
+                in allowed_combinations
+            )
+    return CouponRestrictions(restricted=True, applies=applies)
 
 
 async def _validate_product_coupon_match(
@@ -240,13 +381,9 @@ async def _validate_product_coupon_match(
         return False, "Producto sin precio válido.", None
 
     # Check if product matches coupon restrictions
-    matches = await _product_matches_coupon_restrictions(
-        session=session,
-        coupon_id=coupon.id_coupon,
-        game_detail_id=game_detail_id,
-    )
+    restrictions = await _match_coupon_restrictions(session, coupon.id_coupon, [game_detail_id])
 
-    if not matches:
+    if not restrictions.applies[game_detail_id]:
         return False, "El producto no aplica a este cupón.", None
 
     # Return success with product details
@@ -261,13 +398,17 @@ async def _validate_product_coupon_match(
 
 
 async def _evaluate_coupon_business_rules(
-    coupon: Coupon,
+    coupon: CouponEntry,
     user_id: int,
     cart_items: list[CartItem],
+    restrictions: CouponRestrictions,
     session: AsyncSession,
 ) -> tuple[bool, str]:
     """Replicate Django's validate_coupon logic using database rules.
 
+    ``restrictions`` is the coupon's game detail restriction resolved for
+    the cart's items (see ``_match_coupon_restrictions``).
+
     Returns (is_valid, message), short‑circuiting on the first failure.
     """
     
@@ -275,10 +416,6 @@ async def _evaluate_coupon_business_rules(
     # offset-naive with offset-aware datetimes.
     now = datetime.now(timezone.utc)
 
-    # Total of the cart, used by several rule types.
-    cart_total = sum(item.quantity * item.unit_price for item in cart_items)
-    total_quantity = sum(item.quantity for item in cart_items)
-
     # 1) Basic flags: active and not expired
     if not coupon.is_valid:
         return False, "El cupón no está activo."
@@ -302,285 +439,201 @@ async def _evaluate_coupon_business_rules(
     #    If the coupon has no linked GameDetails (empty set) → skip this check entirely.
     #    If it does have linked GameDetails → at least one cart item's game detail ID
     #    must match one of the allowed (licencia_id, consola_id, duracion_dias_alquiler) combinations.
-    found_match = False
-    for item in cart_items:
-        if item.product_id is not None:
-            # Use helper to check if this product matches coupon restrictions
-            if await _product_matches_coupon_restrictions(
-                session=session,
-                coupon_id=coupon.id_coupon,
-                game_detail_id=item.product_id,
-            ):
-                found_match = True
-                break
-    
-    # If coupon has restrictions, at least one item must match
-    if not found_match:
-        # Check if there are actually restrictions
-        res_gd = await session.execute(
-            select(CouponGameDetail.gamedetail_id)
-            .where(CouponGameDetail.coupon_id == coupon.id_coupon)
-        )
-        coupon_game_detail_ids = {row[0] for row in res_gd.all()}
-        
-        if coupon_game_detail_ids:
-            return False, "El cupón no aplica a los productos del carrito."
-
-    # 4) Evaluate rule rows attached to the coupon
-    result_rules = await session.execute(
-        select(CouponRule).where(CouponRule.coupon_id == coupon.id_coupon)
+    if restrictions.restricted and not any(
+        restrictions.applies.get(item.product_id, False) for item in cart_items
+    ):
+        return False, "El cupón no aplica a los productos del carrito."
+
+    # 4) Rule rows attached to the coupon, compiled once per coupon
+    #    (see services.coupon_rules).
+    plan = await get_rule_plan(session, coupon)
+    message = await plan.evaluate(
+        session, cart_context(coupon.id_coupon, user_id, cart_items, now)
     )
-    rules = result_rules.scalars().all()
+    if message is not None:
+        return False, message
 
-    for rule in rules:
-        rt = (rule.rule_type or "").lower()
-        op = (rule.operator or "").lower()
-        value = rule.value if rule.value is not None else {}
+    return True, "Cupón válido."
 
-        # --- min_order_amount -----------------------------------------
-        if rt == "min_order_amount":
-            v = value if isinstance(value, dict) else {}
-            amount = v.get("amount", value) if isinstance(value, dict) else value
 
-            if op == "gte":
-                if cart_total >= amount:
-                    continue
-                return False, f"El monto mínimo de la orden debe ser {amount}."
+@router.get("/", dependencies=[Depends(enable_compression)])
+async def list_products(
+    request: Request,
+    search: str | None = None,
+    fields: str | None = _FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session),
+    etag: str = Depends(_catalog_etag),
+):
+    """List the whole catalog with prices, optionally filtered by title.
+
+    Served from the in-process catalog snapshot (see
+    ``services.catalog_cache``); ``search`` is resolved against the title
+    index (see ``services.search_index``), including alias expansions
+    (see ``services.aliases``). The unfiltered listing is sent as the
+    snapshot's pre-serialized, pre-compressed body. ``fields`` narrows the
+    returned fields (any of the snapshot's).
+    """
+    snapshot = await get_catalog_snapshot(session)
+    search_norm = normalize_search_text(search) if search else None
+    if not search_norm and not fields:
+        headers = {**_etag_headers(etag), "Vary": "Accept-Encoding"}
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding is not None and len(snapshot.encoded_body()) >= COMPRESSION_MINIMUM_SIZE:
+            headers.update({"Content-Encoding": encoding, "ETag": weaken_etag(etag)})
+        else:
+            encoding = None
+        return Response(
+            await snapshot.encoded_body_async(encoding),
+            media_type="application/json",
+            headers=headers,
+        )
 
-            if op == "between":
-                min_val = v.get("min", 0)
-                max_val = v.get("max", float("inf"))
-                if min_val <= cart_total <= max_val:
-                    continue
-                return False, f"El monto de la orden debe estar entre {min_val} y {max_val}."
+    rows = snapshot.data
+    if search_norm:
+        product_ids = await search_product_ids(session, search_norm)
+        rows = snapshot.filter_by_ids(product_ids)
+    if fields:
+        projection = _projection(fields, _CATALOG_FIELDS)
+        unavailable = [name for name in projection.fields if name not in _CATALOG_FIELDS]
+        if unavailable:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unavailable)}. Allowed: {', '.join(_CATALOG_FIELDS)}.",
+            )
+        rows = [{name: row[name] for name in projection.fields} for row in rows]
+    return ORJSONResponse({"data": rows}, headers=_etag_headers(etag))
 
-        # --- max_order_amount -----------------------------------------
-        elif rt == "max_order_amount":
-            amount = value if isinstance(value, (int, float)) else value.get("amount", float("inf"))
 
-            if op == "lte":
-                if cart_total <= amount:
-                    continue
-                return False, f"El monto máximo de la orden es {amount}."
+@router.get("/stream")
+async def stream_stock_changes(product_ids: list[int] | None = Query(default=None)):
+    """Server-Sent Events stream of stock changes.
+
+    Each ``stock`` event carries ``{"product_id", "game_detail_id", "stock"}``
+    and is emitted when an order creation or cancellation commits. Pass
+    ``product_ids`` (repeatable) to receive only those products. A comment
+    line is sent every ``SSE_KEEPALIVE_SECONDS`` to keep proxies from closing
+    idle connections; clients that fall too far behind are disconnected.
+    """
 
-            if op == "between":
-                min_val = value.get("min", 0)
-                max_val = value.get("max", float("inf"))
-                if min_val <= cart_total <= max_val:
-                    continue
-                return False, f"El monto de la orden debe estar entre {min_val} y {max_val}."
-
-        # --- min_item_quantity ----------------------------------------
-        elif rt == "min_item_quantity":
-            v = value if isinstance(value, dict) else {}
-            min_qty = v.get("quantity", value) if isinstance(value, dict) else value
-            
-            if op == "gte":
-                if total_quantity >= min_qty:
+    async def event_generator():
+        with stock_events.subscribe(product_ids) as subscription:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
                     continue
-                return False, f"Se requieren al menos {min_qty} ítems en el carrito."
+                if event is None:
+                    break
+                yield b"event: stock\ndata: " + orjson.dumps(event) + b"\n\n"
 
-            if op == "eq":
-                if total_quantity == min_qty:
-                    continue
-                return False, f"Se requieren exactamente {min_qty} ítems en el carrito."
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
-            if op == "between":
-                max_qty = v.get("max", float("inf"))
-                if min_qty <= total_quantity <= max_qty:
-                    continue
-                return False, f"La cantidad de ítems debe estar entre {min_qty} y {max_qty}."
 
-        # --- allowed_categories ---------------------------------------
-        elif rt == "allowed_categories":
-            v = value if isinstance(value, dict) else {}
-            allowed = v.get("categories", [])
-            cart_categories = {item.category_id for item in cart_items if item.category_id is not None}
+@router.get("/export")
+async def export_products(since: date | None = None):
+    """Stream the catalog as NDJSON (one product per line) for partner syncs.
 
-            if op == "in":
-                if cart_categories & set(allowed):
-                    continue
-                return False, "Ningún ítem del carrito pertenece a las categorías permitidas."
+    - Query params:
+        * since: only products with ``date_last_modified`` >= this day
+          (YYYY-MM-DD), for incremental pulls
 
-        # --- day_of_week ----------------------------------------------
-        elif rt == "day_of_week":
-            v = value if isinstance(value, dict) else {}
-            allowed_days = v.get("days", [])  # 0=Monday … 6=Sunday
-            current_day = now.weekday()
+    Rows are read through a server-side cursor in batches of
+    ``EXPORT_BATCH_SIZE`` and written out batch by batch, so memory stays
+    flat regardless of catalog size. Each line carries the product columns,
+    ``price``, ``price_discount``, ``stock`` and ``console_ids``.
+    """
 
-            if op == "in":
-                if current_day in allowed_days:
-                    continue
-                day_names = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
-                allowed_names = ", ".join(day_names[d] for d in allowed_days if 0 <= d <= 6)
-                return False, f"El cupón solo es válido los siguientes días: {allowed_names}."
-
-        # --- first_purchase_only --------------------------------------
-        elif rt == "first_purchase_only":
-            res_count = await session.execute(
-                select(func.count(SaleDetail.id_sale_detail)).where(
-                    SaleDetail.usuario_id == user_id
-                )
+    async def ndjson_lines():
+        # The stream outlives the request's dependencies, so it owns its session.
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(
+                ProductRepository.export_query(since).execution_options(yield_per=EXPORT_BATCH_SIZE)
             )
-            sale_count = res_count.scalar() or 0
-            if sale_count == 0:
-                continue
-            return False, "Este cupón es válido solo para la primera compra."
-
-        # --- usage_limit_total ----------------------------------------
-        elif rt == "usage_limit_total":
-            limit = value.get("limit", 0) if isinstance(value, dict) else value
-            if limit is not None:
-                res_count = await session.execute(
-                    select(func.count(CouponRedemption.id)).where(
-                        CouponRedemption.coupon_id == coupon.id_coupon
+            async for rows in result.partitions():
+                yield b"".join(
+                    orjson.dumps(
+                        {
+                            "id_product": row.product_id,
+                            "title": row.title,
+                            "description": row.description,
+                            "date_register": row.date_register,
+                            "date_last_modified": row.date_last_modified,
+                            "image": row.image,
+                            "calification": row.calification,
+                            "puntos_venta": row.puntos_venta,
+                            "puede_rentarse": row.puede_rentarse,
+                            "destacado": row.destacado,
+                            "type_id_id": row.type_id_id,
+                            "tipo_juego_id": row.tipo_juego_id,
+                            "price": row.min_price,
+                            "price_discount": row.min_discount_price,
+                            "stock": row.total_stock,
+                            "console_ids": list(row.console_ids or []),
+                        },
+                        option=orjson.OPT_APPEND_NEWLINE,
                     )
+                    for row in rows
                 )
-                total_used = res_count.scalar() or 0
-                if op in ("lte", "eq"):
-                    if total_used < int(limit):
-                        continue
-                return False, "El cupón ha alcanzado el límite máximo de usos."
-
-        # --- usage_limit_per_user -------------------------------------
-        elif rt == "usage_limit_per_user":
-            limit = value.get("limit", 1) if isinstance(value, dict) else value
-            if limit is not None:
-                res_count = await session.execute(
-                    select(func.count(CouponRedemption.id)).where(
-                        CouponRedemption.coupon_id == coupon.id_coupon,
-                        CouponRedemption.user_id == user_id,
-                    )
-                )
-                user_used = res_count.scalar() or 0
-                if op in ("lte", "eq"):
-                    if user_used < int(limit):
-                        continue
-                return False, "Has alcanzado el límite de usos de este cupón."
 
-        # Unknown / unhandled rule type — pass silently (matches Django fallback)
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
-    return True, "Cupón válido."
 
-
-@router.get("/")
-async def list_products(
-    search: str | None = None,
+@router.get("/pagination", dependencies=[Depends(enable_compression)])
+async def get_products(
+    offset: int = 0,
+    limit: int = 10,
+    cursor: str | None = None,
+    fields: str | None = _FIELDS_QUERY,
     session: AsyncSession = Depends(get_session),
 ):
-    query = select(Product).options(selectinload(Product.consoles)).order_by(Product.id_product)
-
-    if search:
-        search_norm = _normalize_search_text(search)
-        title_expr = func.replace(func.unaccent(func.lower(Product.title)), ' ', '')
-
-        # If search matches an alias, search for all mapped aliases
-        if search_norm in ALIAS_MAP:
-            alias_patterns = [
-                f"%{_normalize_search_text(alias)}%"
-                for alias in ALIAS_MAP[search_norm]
-            ]
-            conditions = [title_expr.ilike(pat) for pat in alias_patterns]
-            query = query.where(or_(*conditions))
-        else:
-            pattern = f"%{search_norm}%"
-            query = query.where(title_expr.ilike(pattern))
-
-    result = await session.execute(query)
-    products = result.scalars().all()
-    product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
-
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id": p.type_id_id,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
-    return {"data": data}
-
-@router.get("/stream")
-async def stream_numbers():
-    async def event_generator():
-        counter = 0
-        while True:
-            counter += 1
-            yield f"data: message {counter}\n\n"
-            await asyncio.sleep(2)
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
-
-
-
-@router.get("/pagination")
-async def get_products(offset: int = 0, limit: int = 10, session: AsyncSession = Depends(get_session)):
-    """Paginate products using classic offset/limit.
+    """Paginate products by ``id_product``.
 
     - Query params:
+        * cursor: ``next_cursor`` from the previous page (keyset pagination;
+          takes precedence over offset)
         * offset: number of items to skip (default 0)
         * limit: max number of items to return (default 10)
+        * fields: comma separated subset of fields to return (sparse fieldset)
+
+    The response includes ``next_cursor`` (None on the last page).
     """
 
-    query = select(Product).order_by(Product.id_product)
-    if offset:
+    projection = _projection(fields, _LISTING_FIELDS)
+    query = projection.select().order_by(Product.id_product)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Product.id_product > last_id)
+    elif offset:
         query = query.offset(offset)
-    query = query.limit(limit)
+    query = query.limit(limit + 1)
     result = await session.execute(query)
-    products = result.scalars().all()
+    products = result.all()
+    has_more = len(products) > limit
+    products = products[:limit]
+    next_cursor = encode_cursor(products[-1].id_product) if has_more else None
     product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
+    prices = await projection.summaries(session, product_ids)
 
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id_id": p.type_id_id,
-            "tipo_juego_id": p.tipo_juego_id,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
-    return {"data": data}
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
+    return ORJSONResponse({"data": data, "next_cursor": next_cursor})
 
 
-@router.get("/favorites")
-async def get_favorites(limit: int = 20, offset: int = 0, session: AsyncSession = Depends(get_session)):
+@router.get("/favorites", dependencies=[Depends(enable_compression)])
+async def get_favorites(
+    limit: int = 20,
+    offset: int = 0,
+    fields: str | None = _FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session),
+    etag: str = Depends(_catalog_etag),
+):
     """
     Obtener productos marcados como favoritos (destacado=True) ordenados por calification (desc).
+    ``fields`` limita los campos devueltos (lista separada por comas).
     """
+    projection = _projection(fields, _FAVORITES_FIELDS)
     query = (
-        select(Product)
-        .options(selectinload(Product.consoles))
+        projection.select()
         .where(Product.destacado.is_(True))
         .order_by(Product.calification.desc())
     )
@@ -588,38 +641,17 @@ async def get_favorites(limit: int = 20, offset: int = 0, session: AsyncSession
         query = query.offset(offset)
     query = query.limit(limit)
     result = await session.execute(query)
-    products = result.scalars().all()
+    products = result.all()
     product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
+    prices = await projection.summaries(session, product_ids)
 
     # serializar a dicts simples para respuesta JSON
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if p.date_register else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
 
-    return {"data": data}
+    return ORJSONResponse({"data": data}, headers=_etag_headers(etag))
 
 
-@router.get("/week-offers")
+@router.get("/week-offers", dependencies=[Depends(enable_compression)])
 async def get_week_offers(
     offset: int = 0,
     limit: int = 20,
@@ -627,8 +659,8 @@ async def get_week_offers(
 ):
     """Return products that have active coupon offers created in the last week.
 
-    A product is considered a "week offer" when there exists at least one
-    Coupon for that product such that:
+    A product is considered a "week offer" when at least one of its
+    GameDetail variants is attached to a Coupon such that:
 
     - percentage_off > 0
     - is_valid is True
@@ -636,201 +668,174 @@ async def get_week_offers(
     - created_at >= now - 7 days
 
     Results are ordered by the coupon creation date (newest first) and
-    paginated with offset/limit. Each product includes the computed
-    ``price`` field (minimum non-zero GameDetail.precio).
+    paginated with offset/limit. Each product includes ``price`` /
+    ``price_discount`` plus the best offer: ``coupon_id``,
+    ``percentage_off``, ``offer_price`` (cheapest couponed variant after the
+    discount) and ``offer_expires_at``. Served from a cached feed (see
+    ``services.week_offers``).
     """
 
-    now = datetime.utcnow()
-    week_ago = now - timedelta(days=7)
-
-    query = (
-        select(Product)
-        .join(Coupon, Coupon.product_id == Product.id_product)
-        .where(
-            Coupon.percentage_off > 0,
-            Coupon.is_valid.is_(True),
-            Coupon.expiration_date > now,
-            Coupon.created_at >= week_ago,
-        )
-        .order_by(Coupon.created_at.desc())
-    )
-
-    if offset:
-        query = query.offset(offset)
-    query = query.limit(limit)
-
-    result = await session.execute(query)
-    products = result.scalars().unique().all()
-    product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
-
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id_id": p.type_id_id,
-            "tipo_juego_id": p.tipo_juego_id,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-        }
-        for p in products
-    ]
-
-    return {"data": data}
+    feed = await get_week_offers_feed(session)
+    return ORJSONResponse({"data": feed[offset:offset + limit]})
 
 
-@router.get("/by-type/{type_id}")
+@router.get("/by-type/{type_id}", dependencies=[Depends(enable_compression)])
 async def get_products_by_type(
     type_id: int,
     session: AsyncSession = Depends(get_session),
     limit: int = 20,
+    fields: str | None = _FIELDS_QUERY,
 ):
     """List products filtered by ``type_id_id``.
 
     Returns the same basic structure as the main /products list
     endpoint, but only for products where Product.type_id_id
-    matches the given ``type_id``.
+    matches the given ``type_id``. ``fields`` narrows the returned fields.
     """
 
-    # Database column is numeric; cast model field to Integer for safe comparison
+    projection = _projection(fields, _BY_TYPE_FIELDS)
     query = (
-        select(Product)
-        .options(selectinload(Product.consoles))
-        .where(cast(Product.type_id_id, Integer) == type_id)
+        projection.select()
+        .where(Product.type_id_id == type_id)
         .order_by(Product.id_product)
         .limit(limit)
     )
 
     result = await session.execute(query)
-    products = result.scalars().all()
+    products = result.all()
+    prices = await projection.summaries(session, [p.id_product for p in products])
 
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
-    return {"data": data}
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
+    return ORJSONResponse({"data": data})
 
 
-@router.get("/by-console/{console_id}")
+@router.get("/by-console/{console_id}", dependencies=[Depends(enable_compression)])
 async def get_products_by_console(
     console_id: int,
     session: AsyncSession = Depends(get_session),
     limit: int = 20,
+    fields: str | None = _FIELDS_QUERY,
 ):
     """List products filtered by console (platform).
 
     Returns the same basic structure as the main /products list
     endpoint, but only for products associated with the given
-    ``console_id``.
+    ``console_id``. ``fields`` narrows the returned fields.
     """
 
+    projection = _projection(fields, _BY_CATEGORY_FIELDS)
     query = (
-        select(Product)
+        projection.select()
         .join(Product.consoles)
-        .options(selectinload(Product.consoles))
         .where(Consoles.id_console == console_id)
         .order_by(Product.id_product)
         .limit(limit)
     )
 
     result = await session.execute(query)
-    products = result.scalars().all()
+    products = result.all()
+    prices = await projection.summaries(session, [p.id_product for p in products])
 
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id": p.type_id_id,
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
-    return {"data": data}
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
+    return ORJSONResponse({"data": data})
 
 
-@router.get("/by-game-type/{game_type_id}")
+@router.get("/by-game-type/{game_type_id}", dependencies=[Depends(enable_compression)])
 async def get_products_by_game_type(
     game_type_id: int,
     limit: int = 20,
+    fields: str | None = _FIELDS_QUERY,
     session: AsyncSession = Depends(get_session),
 ):
     """List products filtered by ``tipo_juego_id`` (game type).
 
     Returns the same basic structure as the main /products list
     endpoint, but only for products where Product.tipo_juego_id
-    matches the given ``game_type_id``.
+    matches the given ``game_type_id``. ``fields`` narrows the returned
+    fields.
     """
 
+    projection = _projection(fields, _BY_CATEGORY_FIELDS)
     query = (
-        select(Product)
-        .options(selectinload(Product.consoles))
-        .where(cast(Product.tipo_juego_id, Integer) == game_type_id)
+        projection.select()
+        .where(Product.tipo_juego_id == game_type_id)
         .order_by(Product.id_product)
         .limit(limit)
     )
 
     result = await session.execute(query)
-    products = result.scalars().all()
+    products = result.all()
+    prices = await projection.summaries(session, [p.id_product for p in products])
 
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id": p.type_id_id,
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
-    return {"data": data}
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
+    return ORJSONResponse({"data": data})
+
+
+async def _filter_facets(
+    session: AsyncSession,
+    matching_ids: list[int] | None,
+    type_id: int | None,
+    console_id: int | None,
+    game_type_id: int | None,
+) -> dict:
+    """Facet counts for ``/filter`` in a single GROUPING SETS query.
+
+    Each facet is counted with every active filter except its own, so the
+    sidebar keeps showing the alternatives of the facet being filtered on.
+    Counts are distinct products; products without a value are skipped.
+    """
+    console_col = products_products_consola.c.consoles_id
+    type_col = Product.type_id_id
+    game_col = Product.tipo_juego_id
 
+    console_cond = console_col == console_id if console_id is not None else None
+    type_cond = type_col == type_id if type_id is not None else None
+    game_cond = game_col == game_type_id if game_type_id is not None else None
 
-@router.get("/filter")
+    def product_count(*conds):
+        conds = [c for c in conds if c is not None]
+        counted = func.count(distinct(Product.id_product))
+        return counted.filter(and_(*conds)) if conds else counted
+
+    query = (
+        select(
+            func.grouping(console_col).label("by_console"),
+            func.grouping(type_col).label("by_type"),
+            console_col.label("console_id"),
+            type_col.label("type_id"),
+            game_col.label("game_type_id"),
+            product_count(type_cond, game_cond).label("console_count"),
+            product_count(console_cond, game_cond).label("type_count"),
+            product_count(console_cond, type_cond).label("game_type_count"),
+        )
+        .select_from(Product)
+        .outerjoin(
+            products_products_consola,
+            products_products_consola.c.products_id == Product.id_product,
+        )
+        .group_by(func.grouping_sets(console_col, type_col, game_col))
+    )
+    if matching_ids is not None:
+        query = query.where(Product.id_product.in_(matching_ids))
+
+    facets = {"consoles": [], "type_id": [], "game_type_id": []}
+    result = await session.execute(query)
+    for row in result.all():
+        if row.by_console == 0:
+            key, value, count = "consoles", row.console_id, row.console_count
+        elif row.by_type == 0:
+            key, value, count = "type_id", row.type_id, row.type_count
+        else:
+            key, value, count = "game_type_id", row.game_type_id, row.game_type_count
+        if value is not None and count:
+            facets[key].append({"id": value, "count": count})
+
+    for values in facets.values():
+        values.sort(key=lambda item: (-item["count"], item["id"]))
+    return facets
+
+
+@router.get("/filter", dependencies=[Depends(enable_compression)])
 async def filter_products(
     q: str | None = None,
     type_id: int | None = None,
@@ -838,6 +843,9 @@ async def filter_products(
     game_type_id: int | None = None,
     offset: int = 0,
     limit: int = 20,
+    cursor: str | None = None,
+    facets: bool = False,
+    fields: str | None = _FIELDS_QUERY,
     session: AsyncSession = Depends(get_session),
 ):
     """Filter products by optional text search, type, console and game type.
@@ -848,81 +856,76 @@ async def filter_products(
         * console_id: filters by Consoles.id_console
         * game_type_id: filters by Product.tipo_juego_id
     If any param is omitted or null, that filter is not applied.
-    Supports offset/limit pagination.
+    Supports offset/limit pagination, or keyset pagination on ``id_product``
+    via ``cursor`` (the ``next_cursor`` of the previous page).
+    With ``facets=true`` the response also carries ``facets``: product
+    counts per console, ``type_id`` and ``game_type_id`` for the current
+    ``q`` and filters (``[{"id": ..., "count": ...}]``, largest first).
+    ``fields`` narrows the returned product fields (sparse fieldset).
     """
 
-    query = select(Product).options(selectinload(Product.consoles))
+    projection = _projection(fields, _LISTING_FIELDS)
+    query = projection.select()
     conditions = []
+    matching_ids = None
 
     if q:
-        q_norm = _normalize_search_text(q)
-        title_expr = func.replace(func.unaccent(func.lower(Product.title)), ' ', '')
-        if q_norm in ALIAS_MAP:
-            alias_patterns = [
-                f"%{_normalize_search_text(alias)}%"
-                for alias in ALIAS_MAP[q_norm]
-            ]
-            conditions.append(or_(*[title_expr.ilike(pat) for pat in alias_patterns]))
-        else:
-            conditions.append(title_expr.ilike(f"%{q_norm}%"))
+        matching_ids = await search_product_ids(session, normalize_search_text(q))
+        if not matching_ids:
+            response = {"data": [], "next_cursor": None}
+            if facets:
+                response["facets"] = {"consoles": [], "type_id": [], "game_type_id": []}
+            return ORJSONResponse(response)
+        conditions.append(Product.id_product.in_(matching_ids))
 
     if type_id is not None:
-        conditions.append(cast(Product.type_id_id, Integer) == type_id)
+        conditions.append(Product.type_id_id == type_id)
 
     if game_type_id is not None:
-        conditions.append(cast(Product.tipo_juego_id, Integer) == game_type_id)
+        conditions.append(Product.tipo_juego_id == game_type_id)
 
     if console_id is not None:
         query = query.join(Product.consoles)
         conditions.append(Consoles.id_console == console_id)
 
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        conditions.append(Product.id_product > last_id)
+
     if conditions:
         query = query.where(*conditions)
 
     query = query.order_by(Product.id_product)
-    if offset:
+    if offset and not cursor:
         query = query.offset(offset)
-    query = query.limit(limit)
+    query = query.limit(limit + 1)
 
     result = await session.execute(query)
-    products = result.scalars().all()
+    products = result.all()
+    has_more = len(products) > limit
+    products = products[:limit]
+    next_cursor = encode_cursor(products[-1].id_product) if has_more else None
     product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
+    prices = await projection.summaries(session, product_ids)
 
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id_id": p.type_id_id,
-            "tipo_juego_id": p.tipo_juego_id,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
 
-    return {"data": data}
+    response = {"data": data, "next_cursor": next_cursor}
+    if facets:
+        response["facets"] = await _filter_facets(
+            session, matching_ids, type_id, console_id, game_type_id
+        )
+    return ORJSONResponse(response)
 
 
-@router.get("/by-date")
+@router.get("/by-date", dependencies=[Depends(enable_compression)])
 async def get_products_from_date(
     from_date: date | None = Query(default=None),
     date_param: date | None = Query(default=None, alias="date"),
     offset: int = 0,
     limit: int = 20,
+    cursor: str | None = None,
+    fields: str | None = _FIELDS_QUERY,
     session: AsyncSession = Depends(get_session),
 ):
     """Filter products by registration date from a given day until today.
@@ -931,6 +934,9 @@ async def get_products_from_date(
         * from_date or date: starting date (YYYY-MM-DD) — either name is accepted
         * offset: number of items to skip (default 0)
         * limit: max number of items to return (default 20)
+        * cursor: ``next_cursor`` from the previous page; encodes the last
+          ``(date_register, id_product)`` and takes precedence over offset
+        * fields: comma separated subset of fields to return (sparse fieldset)
 
     Returns products whose ``date_register`` is between the given date
     and today's date (inclusive).
@@ -943,10 +949,11 @@ async def get_products_from_date(
             detail="Query parameter 'from_date' (or 'date') is required.",
         )
 
+    projection = _projection(fields, _LISTING_FIELDS)
     today = datetime.utcnow().date()
     query = (
-        select(Product)
-        .options(selectinload(Product.consoles))
+        # date_register is always selected: the cursor is built from it
+        projection.select(Product.date_register)
         .where(
             Product.date_register >= resolved_date,
             Product.date_register <= today,
@@ -954,77 +961,49 @@ async def get_products_from_date(
         .order_by(Product.date_register.desc(), Product.id_product)
     )
 
-    if offset:
+    if cursor:
+        last_date, last_id = decode_cursor(cursor, date, int)
+        query = query.where(
+            or_(
+                Product.date_register < last_date,
+                and_(Product.date_register == last_date, Product.id_product > last_id),
+            )
+        )
+    elif offset:
         query = query.offset(offset)
-    query = query.limit(limit)
+    query = query.limit(limit + 1)
 
     result = await session.execute(query)
-    products = result.scalars().all()
+    products = result.all()
+    has_more = len(products) > limit
+    products = products[:limit]
+    next_cursor = (
+        encode_cursor(products[-1].date_register, products[-1].id_product)
+        if has_more
+        else None
+    )
     product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
-
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id_id": p.type_id_id,
-            "tipo_juego_id": p.tipo_juego_id,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
+    prices = await projection.summaries(session, product_ids)
 
-    return {"data": data}
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
 
+    return ORJSONResponse({"data": data, "next_cursor": next_cursor})
 
-@router.get("/combination-price/{id_product}")
-async def get_combination_price_by_game(id_product: int, session: AsyncSession = Depends(get_session)):
-    """Get optimized price combinations for a product.
-
-    The response groups game details by the combination of
-    (``consola``, ``licencia``, ``duracion_dias_alquiler``, ``precio``,
-    ``precio_descuento``) and aggregates their stock.
 
-    Each item in ``data`` has the shape:
+async def _get_combination_prices(
+    session: AsyncSession, product_ids: list[int]
+) -> dict[int, dict]:
+    """Return product_id -> {"product_type", "data"} for combination prices.
 
-    {
-        "pk": int,  # representative id_game_detail for the group
-        "consola": int,
-        "desc_console": str,
-        "licencia": int,
-        "desc_licence": str,
-        "stock": int,  # total stock for that combination
-        "precio": int,
-        "precio_descuento": int,
-        "duracion_dias_alquiler": int,
-    }
+    One joined query over Product -> GameDetail (stock > 0, precio > 0) ->
+    Consoles/Licenses, grouped in a single pass by (consola, licencia,
+    duracion_dias_alquiler, precio, precio_descuento) with stock summed.
+    Unknown products map to ``{"product_type": None, "data": []}``.
     """
-
-    # Obtener el tipo de producto (equivalente a product.type_id.id_product_type en Django)
-    result_product = await session.execute(
-        select(Product).filter(Product.id_product == id_product)
-    )
-    product = result_product.scalars().first()
-    product_type = getattr(product, "type_id_id", None) if product else None
-
-    # Traer cada GameDetail que cumpla las condiciones (sin agrupar),
-    # junto con descripciones de consola y licencia.
     query = (
         select(
+            Product.id_product,
+            Product.type_id_id,
             GameDetail.id_game_detail,
             GameDetail.consola_id,
             Consoles.descripcion.label("desc_console"),
@@ -1035,15 +1014,20 @@ async def get_combination_price_by_game(id_product: int, session: AsyncSession =
             GameDetail.precio,
             GameDetail.precio_descuento,
         )
-        .select_from(GameDetail)
-        .join(Consoles, GameDetail.consola_id == Consoles.id_console, isouter=True)
-        .join(Licenses, GameDetail.licencia_id == Licenses.id_license, isouter=True)
-        .where(
-            GameDetail.producto_id == id_product,
-            GameDetail.stock > 0,
-            GameDetail.precio > 0,
+        .select_from(Product)
+        .outerjoin(
+            GameDetail,
+            and_(
+                GameDetail.producto_id == Product.id_product,
+                GameDetail.stock > 0,
+                GameDetail.precio > 0,
+            ),
         )
+        .outerjoin(Consoles, GameDetail.consola_id == Consoles.id_console)
+        .outerjoin(Licenses, GameDetail.licencia_id == Licenses.id_license)
+        .where(Product.id_product.in_(product_ids))
         .order_by(
+            Product.id_product,
             GameDetail.consola_id,
             GameDetail.licencia_id,
             GameDetail.duracion_dias_alquiler,
@@ -1052,15 +1036,21 @@ async def get_combination_price_by_game(id_product: int, session: AsyncSession =
     )
 
     result = await session.execute(query)
-    rows = result.all()
 
-    # Group by (consola, desc_console, licencia, desc_licence,
+    combinations = {pid: {"product_type": None, "data": []} for pid in product_ids}
+    # Group by (product, consola, desc_console, licencia, desc_licence,
     #           duracion_dias_alquiler, precio, precio_descuento)
     groups: dict[tuple, dict] = {}
-    for row in rows:
+    for row in result.all():
+        entry = combinations[row.id_product]
+        entry["product_type"] = row.type_id_id
+        if row.id_game_detail is None:
+            continue
+
         precio = row.precio or 0
         precio_descuento = row.precio_descuento or 0
         key = (
+            row.id_product,
             row.consola_id,
             row.desc_console or "",
             row.licencia_id,
@@ -1082,234 +1072,332 @@ async def get_combination_price_by_game(id_product: int, session: AsyncSession =
                 "precio_descuento": precio_descuento,
                 "duracion_dias_alquiler": row.duracion_dias_alquiler,
             }
+            entry["data"].append(groups[key])
         else:
             groups[key]["stock"] += row.stock or 0
 
-    data = list(groups.values())
+    return combinations
+
+
+class CombinationPriceBatchRequest(BaseModel):
+    product_ids: conlist(int, min_length=1, max_length=COMBINATION_PRICE_BATCH_MAX)
+
+
+@router.post("/combination-price/batch")
+async def get_combination_prices_batch(
+    payload: CombinationPriceBatchRequest,
+    session: AsyncSession = Depends(get_session),
+):
+    """Combination prices for many products in one call.
+
+    Body: ``{"product_ids": [int, ...]}`` (up to
+    ``COMBINATION_PRICE_BATCH_MAX`` ids). ``data`` maps each requested
+    product id to ``{"product_id", "product_type", "data"}``, where ``data``
+    has the same shape as ``GET /combination-price/{id_product}``. Costs a
+    single query regardless of the number of ids.
+    """
+    product_ids = list(dict.fromkeys(payload.product_ids))
+    combinations = await _get_combination_prices(session, product_ids)
+
+    return {
+        "message": "proceso exitoso",
+        "data": {
+            pid: {"product_id": pid, **combinations[pid]}
+            for pid in product_ids
+        },
+        "code": "00",
+        "status": 200,
+    }
+
+
+@router.get("/combination-price/{id_product}")
+async def get_combination_price_by_game(
+    id_product: int,
+    session: AsyncSession = Depends(get_session),
+    etag: str = Depends(_catalog_etag),
+):
+    """Get optimized price combinations for a product.
+
+    The response groups game details by the combination of
+    (``consola``, ``licencia``, ``duracion_dias_alquiler``, ``precio``,
+    ``precio_descuento``) and aggregates their stock.
+
+    Each item in ``data`` has the shape:
+
+    {
+        "pk": int,  # representative id_game_detail for the group
+        "consola": int,
+        "desc_console": str,
+        "licencia": int,
+        "desc_licence": str,
+        "stock": int,  # total stock for that combination
+        "precio": int,
+        "precio_descuento": int,
+        "duracion_dias_alquiler": int,
+    }
+    """
+
+    combinations = (await _get_combination_prices(session, [id_product]))[id_product]
 
     payload = {
         "message": "proceso exitoso",
         "product_id": id_product,
-        "product_type": product_type,
-        "data": data,
+        "product_type": combinations["product_type"],
+        "data": combinations["data"],
         "code": "00",
         "status": 200,
     }
-    return JSONResponse(payload)
+    return ORJSONResponse(payload, headers=_etag_headers(etag))
+
+
+def _parse_id_list(raw: str, limit: int) -> list[int]:
+    """Parse a comma separated id list (deduplicated, order kept)."""
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers.")
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids is required.")
+    if len(ids) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} ids per request.")
+    return ids
+
+
+@router.get("/batch", dependencies=[Depends(enable_compression)])
+async def get_products_batch(
+    ids: str = Query(..., description="Comma separated product ids, e.g. 3,1,2"),
+    fields: str | None = _FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session),
+    etag: str = Depends(_catalog_etag),
+):
+    """Product details for many ids at once.
 
+    ``data`` follows the order of ``ids`` (duplicates removed); each item has
+    the same shape as ``GET /{id_product}``'s ``data``, or is ``null`` when
+    the product does not exist. Missing ids are also listed in ``missing``.
+    ``fields`` narrows the returned fields.
 
-@router.get("/search")
-async def search_products(q: str, offset: int = 0, limit: int = 20, use_trgm: bool = False, session: AsyncSession = Depends(get_session)):
-    if not q:
-        return {"data": []}
+    Costs one product query plus the product_summary lookup (and its live
+    fallback for ids without a summary row), regardless of how many ids
+    are requested.
+    """
+    product_ids = _parse_id_list(ids, PRODUCT_BATCH_MAX)
+    projection = _projection(fields, _DETAIL_FIELDS)
 
-    search_norm = _normalize_search_text(q)
-    title_expr = func.replace(func.unaccent(func.lower(Product.title)), ' ', '')
+    result = await session.execute(projection.by_ids(), {"product_ids": product_ids})
+    products = {p.id_product: p for p in result.all()}
+    summaries = await projection.summaries(session, list(products))
 
-    if search_norm in ALIAS_MAP:
-        alias_patterns = [
-            f"%{_normalize_search_text(alias)}%"
-            for alias in ALIAS_MAP[search_norm]
-        ]
-        conditions = [title_expr.ilike(pat) for pat in alias_patterns]
-        base = select(Product).options(selectinload(Product.consoles)).where(or_(*conditions))
-    else:
-        pattern = f"%{search_norm}%"
-        base = select(Product).options(selectinload(Product.consoles)).where(title_expr.ilike(pattern))
+    data = [
+        projection.serialize(products[pid], summaries.get(pid)) if pid in products else None
+        for pid in product_ids
+    ]
+    missing = [pid for pid in product_ids if pid not in products]
+
+    payload = {
+        'message': 'proceso exitoso',
+        'data': data,
+        'missing': missing,
+        'code': '00',
+        'status': 200,
+    }
+    return ORJSONResponse(payload, headers=_etag_headers(etag))
 
+
+@router.get("/autocomplete")
+async def autocomplete_products(
+    q: str = "",
+    limit: int = Query(default=AUTOCOMPLETE_TOP_N, ge=1, le=AUTOCOMPLETE_TOP_N),
+):
+    """Title suggestions for a search box prefix.
+
+    Served entirely from the in-memory prefix trie (see
+    ``services.autocomplete``): matches title words, multi-word prefixes and
+    search aliases, most sold / best rated first. Never hits the database.
+    """
+    return ORJSONResponse({"data": autocomplete(q, limit)})
+
+
+@router.get("/search", dependencies=[Depends(enable_compression)])
+async def search_products(
+    q: str,
+    offset: int = 0,
+    limit: int = 20,
+    use_trgm: bool = False,
+    fields: str | None = _FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session),
+):
+    """Search products by title (unaccented, case-insensitive, alias-aware).
+
+    Matching and ranking run on the in-memory title index; only the
+    requested page is loaded from the database. When fewer than
+    ``SEARCH_FUZZY_MIN_RESULTS`` titles contain ``q``, typo-tolerant matches
+    (``TitleSearchIndex.fuzzy_search``) are appended after them. ``use_trgm``
+    orders matches by trigram similarity to ``q`` instead of match position.
+    ``fields`` narrows the returned fields.
+    """
+    projection = _projection(fields, _SEARCH_FIELDS)
+    if not q:
+        return {"data": []}
+
+    index = await refresh_title_index(session)
+    product_ids = index.search_term(normalize_search_text(q))
+    if len(product_ids) < SEARCH_FUZZY_MIN_RESULTS:
+        # too few substring matches: append typo-tolerant matches
+        found = set(product_ids)
+        product_ids += [pid for pid in index.fuzzy_search(q) if pid not in found]
     if use_trgm:
-        base = base.order_by(func.similarity(Product.title, q).desc())
+        product_ids.sort(key=lambda pid: index.similarity(pid, q), reverse=True)
 
-    if offset:
-        base = base.offset(offset)
-    base = base.limit(limit)
+    page_ids = product_ids[offset:offset + limit]
+    if not page_ids:
+        return {"data": []}
 
-    result = await session.execute(base)
-    products = result.scalars().all()
-    product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
+    result = await session.execute(projection.by_ids(), {"product_ids": page_ids})
+    by_id = {p.id_product: p for p in result.all()}
+    products = [by_id[pid] for pid in page_ids if pid in by_id]
+    prices = await projection.summaries(session, list(by_id))
 
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "type_id": p.type_id_id,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
-        for p in products
-    ]
-    return {"data": data}
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in products]
+    return ORJSONResponse({"data": data})
 
 
-@router.get("/most-sold")
+@router.get("/most-sold", dependencies=[Depends(enable_compression)])
 async def get_most_sold_products(
     limit: int = 20,
     offset: int = 0,
+    cursor: str | None = None,
+    window: Literal["all", "7d", "30d"] = "all",
+    fields: str | None = _FIELDS_QUERY,
     session: AsyncSession = Depends(get_session),
 ):
     """Return products ordered by number of sales (most sold first).
 
-    Counts how many orders exist in ``OrderBuy`` for each product and
-    returns products sorted by that count in descending order. Supports
-    offset/limit pagination and includes the computed ``price`` field.
+    Served from the precomputed sales leaderboard (see
+    ``services.leaderboard``) for the requested ``window``: all-time, or the
+    last 7 / 30 days. Products are sorted by sales count in descending order
+    (ties broken by ``id_product``). Supports offset/limit pagination or
+    keyset pagination via ``cursor`` (encodes the last ``(sales_count,
+    id_product)``), and includes the computed ``price`` field. ``fields``
+    narrows the returned fields (``sales_count`` included).
     """
 
-    query = (
-        select(Product, func.count(SaleDetail.id_sale_detail).label("sales_count"))
-        .options(selectinload(Product.consoles))
-        .join(SaleDetail, SaleDetail.producto_id == Product.id_product)
-        .group_by(Product.id_product)
-        .order_by(func.count(SaleDetail.id_sale_detail).desc())
-    )
+    projection = _projection(fields, _MOST_SOLD_FIELDS, extra=("sales_count",))
+    ranking = await get_ranking(session, window)
 
-    if offset:
-        query = query.offset(offset)
-    query = query.limit(limit)
+    start = offset
+    if cursor:
+        last_count, last_id = decode_cursor(cursor, int, int)
+        start = bisect_right(ranking, (-last_count, last_id), key=lambda entry: (-entry[1], entry[0]))
+    page = ranking[start:start + limit]
+    has_more = start + limit < len(ranking)
+    next_cursor = encode_cursor(page[-1][1], page[-1][0]) if has_more and page else None
 
-    result = await session.execute(query)
-    rows = result.all()
-    products = [row[0] for row in rows]
-    sales_counts = {row[0].id_product: row[1] for row in rows}
-    product_ids = [p.id_product for p in products]
-    min_prices = await _get_min_prices_for_products(session, product_ids)
-    min_discount_prices = await _get_min_discount_prices_for_products(session, product_ids)
+    sales_counts = dict(page)
+    product_ids = list(sales_counts)
+    result = await session.execute(projection.by_ids(), {"product_ids": product_ids})
+    by_id = {p.id_product: p for p in result.all()}
+    products = [by_id[pid] for pid in product_ids if pid in by_id]
+    prices = await projection.summaries(session, product_ids)
 
     data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "date_last_modified": p.date_last_modified.isoformat() if getattr(p, "date_last_modified", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-            "type_id_id": p.type_id_id,
-            "tipo_juego_id": p.tipo_juego_id,
-            "price": min_prices.get(p.id_product),
-            "price_discount": min_discount_prices.get(p.id_product),
-            "sales_count": int(sales_counts.get(p.id_product, 0)),
-            "consoles": [
-                {"id_console": c.id_console}
-                for c in getattr(p, "consoles", []) or []
-            ],
-        }
+        projection.serialize(
+            p,
+            prices.get(p.id_product),
+            sales_count=int(sales_counts.get(p.id_product, 0)),
+        )
         for p in products
     ]
 
-    return {"data": data}
+    return ORJSONResponse({"data": data, "next_cursor": next_cursor})
 
 
 @router.get("/{id_product}")
-async def get_product_by_id(id_product: int, session: AsyncSession = Depends(get_session)):
+async def get_product_by_id(
+    id_product: int,
+    fields: str | None = _FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session),
+    etag: str = Depends(_catalog_etag),
+):
 
-    result = await session.execute(
-        select(Product)
-        .options(selectinload(Product.consoles))
-        .filter(Product.id_product == id_product)
-    )
-    product = result.scalars().first()
+    projection = _projection(fields, _DETAIL_FIELDS)
+    result = await session.execute(projection.by_id(), {"id_product": id_product})
+    product = result.first()
 
     if not product:
         payload = {'message': 'producto no existente', 'data': [], 'code': '00', 'status': 200}
-        return JSONResponse(payload)
-
-    # primer precio (para resumen)
-    res_price = await session.execute(
-        select(GameDetail).filter(GameDetail.producto_id == id_product, GameDetail.precio > 0).limit(1)
-    )
-    prices_game = res_price.scalars().first()
+        return ORJSONResponse(payload, headers=_etag_headers(etag))
 
-    # stock total disponible (stock > 0)
-    res_stock = await session.execute(
-        select(func.sum(GameDetail.stock)).filter(GameDetail.producto_id == id_product, GameDetail.stock > 0)
-    )
-    stock_sum = res_stock.scalar() or 0
-
-    data = {
-        "id_product": product.id_product,
-        "title": getattr(product, "title", None),
-        "description": getattr(product, "description", None),
-        "date_register": product.date_register.isoformat() if getattr(product, "date_register", None) else None,
-        "date_last_modified": getattr(product, "date_last_modified").isoformat() if getattr(product, "date_last_modified", None) else None,
-        "image": getattr(product, "image", None),
-        "calification": getattr(product, "calification", None),
-        "puntos_venta": getattr(product, "puntos_venta", None),
-        "puede_rentarse": getattr(product, "puede_rentarse", None),
-        "destacado": getattr(product, "destacado", None),
-        "stock": stock_sum,
-        "precio_descuento": getattr(prices_game, "precio_descuento", None) if prices_game else None,
-        "price": getattr(prices_game, "precio", None) if prices_game else None,
-        "consoles": [
-            {"id_console": c.id_console}
-            for c in getattr(product, "consoles", []) or []
-        ],
-    }
+    # precios, stock total disponible (stock > 0) y consolas desde product_summary
+    summaries = await projection.summaries(session, [id_product])
+    data = projection.serialize(product, summaries.get(id_product))
 
     payload = {'message': 'proceso exitoso', 'data': data, 'code': '00', 'status': 200}
-    return JSONResponse(payload)
+    return ORJSONResponse(payload, headers=_etag_headers(etag))
+
+
+_RELATED_FIELDS = (
+    "id_product", "title", "description", "date_register", "image",
+    "calification", "puntos_venta", "puede_rentarse", "destacado",
+)
 
 
 @router.get("/{id_product}/related")
-async def get_related_products(id_product: int, limit: int = 10, session: AsyncSession = Depends(get_session)):
+async def get_related_products(
+    id_product: int,
+    limit: int = 10,
+    fields: str | None = _FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session),
+):
     """Return products related to the given product.
 
-    Relation is defined as sharing the same ``tipo_juego_id`` and excluding the
-    product itself. Results are limited (default 10).
+    Uses the precomputed co-purchase / co-like neighbours (see
+    ``services.recommendations``), served from the catalog snapshot. Products
+    without neighbours fall back to products sharing the same
+    ``tipo_juego_id`` (excluding the product itself), best rated first.
+    Results are limited (default 10). ``fields`` narrows the returned fields.
     """
 
-    # Get base product
-    result = await session.execute(select(Product).filter(Product.id_product == id_product))
-    product = result.scalars().first()
-    if not product:
-        return {"data": []}
-
-    tipo_juego_id = getattr(product, "tipo_juego_id", None)
-    if not tipo_juego_id:
-        return {"data": []}
+    projection = _projection(fields, _RELATED_FIELDS)
+    related_ids = await get_related_ids(session, id_product)
+    if related_ids and all(name in _CATALOG_FIELDS for name in projection.fields):
+        snapshot = await get_catalog_snapshot(session)
+        rows = snapshot.rows_for_ids(related_ids)[:limit]
+        if rows:
+            return ORJSONResponse({"data": [{name: row[name] for name in projection.fields} for row in rows]})
+
+    if related_ids:
+        result = await session.execute(projection.by_ids(), {"product_ids": list(related_ids[:limit])})
+        by_id = {p.id_product: p for p in result.all()}
+        related_products = [by_id[pid] for pid in related_ids[:limit] if pid in by_id]
+    else:
+        related_products = []
 
-    related_query = (
-        select(Product)
-        .where(
-            Product.tipo_juego_id == tipo_juego_id,
-            Product.id_product != id_product,
+    if not related_products:
+        # Get base product
+        result = await session.execute(
+            select(Product.tipo_juego_id).filter(Product.id_product == id_product)
         )
-        .order_by(Product.calification.desc())
-        .limit(limit)
-    )
-
-    rel_result = await session.execute(related_query)
-    related_products = rel_result.scalars().all()
+        tipo_juego_id = result.scalar()
+        if not tipo_juego_id:
+            return {"data": []}
+
+        related_query = (
+            projection.select()
+            .where(
+                Product.tipo_juego_id == tipo_juego_id,
+                Product.id_product != id_product,
+            )
+            .order_by(Product.calification.desc())
+            .limit(limit)
+        )
+        related_products = (await session.execute(related_query)).all()
 
-    data = [
-        {
-            "id_product": p.id_product,
-            "title": p.title,
-            "description": p.description,
-            "date_register": p.date_register.isoformat() if getattr(p, "date_register", None) else None,
-            "image": p.image,
-            "calification": p.calification,
-            "puntos_venta": p.puntos_venta,
-            "puede_rentarse": p.puede_rentarse,
-            "destacado": p.destacado,
-        }
-        for p in related_products
-    ]
+    prices = await projection.summaries(session, [p.id_product for p in related_products])
+    data = [projection.serialize(p, prices.get(p.id_product)) for p in related_products]
 
-    return {"data": data}
+    return ORJSONResponse({"data": data})
 
 
 @router.post("/coupon/{code}", response_model=ValidateCouponResponse)
@@ -1341,17 +1429,9 @@ async def validate_coupon_for_product(
 
     now = datetime.now(timezone.utc)
 
-    # Fetch coupon by code applying early filters:
-    # - not expired
-    # - user binding: coupon.user_id IS NULL (public) OR matches the requester
-    result = await session.execute(
-        select(Coupon).where(
-            func.lower(Coupon.name_coupon) == code.lower(),
-            Coupon.expiration_date > now,
-            Coupon.is_valid.is_(True),
-        ).limit(1)
-    )
-    coupon = result.scalars().first()
+    # Active (valid, not expired) coupon by case-insensitive code, usually
+    # served from the coupon directory (see services.coupon_directory).
+    coupon = await lookup_coupon(session, code, now)
 
     if not coupon:
         raise HTTPException(
@@ -1359,10 +1439,16 @@ async def validate_coupon_for_product(
             detail="Cupón no encontrado o no activo.",
         )
 
+    # Resolved once for the whole cart; used by the rules and the discount.
+    restrictions = await _match_coupon_restrictions(
+        session, coupon.id_coupon, [item.product_id for item in payload.cart_items]
+    )
+
     is_valid, message = await _evaluate_coupon_business_rules(
         coupon=coupon,
         user_id=current_user.id,
         cart_items=payload.cart_items,
+        restrictions=restrictions,
         session=session,
     )
 
@@ -1378,17 +1464,9 @@ async def validate_coupon_for_product(
         discount_factor = (100 - coupon.percentage_off) / 100.0
         discounted_total = 0.0
 
-        # Resolve which items are covered by this coupon's game_details M2M.
-        # Use helper method to check if each product matches coupon restrictions.
+        # Items covered by this coupon's game_details M2M.
         for item in payload.cart_items:
-            # Check if product matches coupon restrictions using helper method
-            applies = await _product_matches_coupon_restrictions(
-                session=session,
-                coupon_id=coupon.id_coupon,
-                game_detail_id=item.product_id,
-            ) if item.product_id is not None else False
-
-            if applies:
+            if restrictions.applies.get(item.product_id, False):
                 discounted_unit_price = item.unit_price * discount_factor
                 discounted_line_total = discounted_unit_price * item.quantity
                 discounted_total += discounted_line_total
@@ -1406,14 +1484,8 @@ async def validate_coupon_for_product(
 
         total_after = discounted_total  # moved outside the loop
 
-        # Check if coupon has restrictions; if so and no items matched, mark as invalid
-        res_gd_check = await session.execute(
-            select(CouponGameDetail.gamedetail_id)
-            .where(CouponGameDetail.coupon_id == coupon.id_coupon)
-        )
-        coupon_has_restrictions = bool(res_gd_check.first())
-        
-        if coupon_has_restrictions and not discounted_items:
+        # If the coupon has restrictions and no items matched, mark as invalid
+        if restrictions.restricted and not discounted_items:
             return ValidateCouponResponse(
                 valid=False,
                 message="El cupón no aplica a los productos del carrito.",
@@ -0,0 +1,130 @@
+"""Precompiled search alias groups.
+
+Aliases live in a JSON data file (``SEARCH_ALIASES_FILE``, defaulting to
+``app/data/search_aliases.json``) mapping a term to its aliases, e.g.
+``{"rdr2": ["reddeadredemption2", "red dead"]}``; a list of term groups is
+accepted as well.  The file is compiled once into connected alias groups:
+
+  * every term is normalized with ``normalize_search_text``;
+  * relations are made symmetric and transitive (union-find), so any member
+    of a group resolves to the whole group;
+  * each group keeps its terms as word patterns (the words of the term,
+    joined), which the title index matches on whole title words only
+    (``TitleSearchIndex.search_words``), so a short key such as "cod" does
+    not match inside "Codename".
+
+Lookups are a dict access on an already-normalized term.  The file's mtime
+is checked at most every ``SEARCH_ALIASES_CHECK_SECONDS`` and the groups are
+recompiled when it changes, so aliases can be edited without a deploy.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.util.search_text import normalize_search_text, search_tokens
+
+SEARCH_ALIASES_FILE = Path(
+    os.getenv(
+        "SEARCH_ALIASES_FILE",
+        str(Path(__file__).resolve().parent.parent / "data" / "search_aliases.json"),
+    )
+)
+SEARCH_ALIASES_CHECK_SECONDS = float(os.getenv("SEARCH_ALIASES_CHECK_SECONDS", "30"))
+
+
+@dataclass(frozen=True)
+class AliasGroup:
+    """A connected set of equivalent, normalized search terms."""
+
+    terms: frozenset[str]
+    patterns: tuple[str, ...]
+
+
+def _raw_groups(raw) -> list[list[str]]:
+    if isinstance(raw, dict):
+        return [[key, *values] for key, values in raw.items()]
+    if isinstance(raw, list):
+        return [list(group) for group in raw]
+    raise ValueError("alias data must be an object or a list of groups")
+
+
+def compile_alias_groups(raw) -> dict[str, AliasGroup]:
+    """Compile raw alias data into a normalized term -> AliasGroup mapping."""
+    parent: dict[str, str] = {}
+
+    def find(term: str) -> str:
+        parent.setdefault(term, term)
+        while parent[term] != term:
+            parent[term] = parent[parent[term]]
+            term = parent[term]
+        return term
+
+    for group in _raw_groups(raw):
+        normalized = [normalize_search_text(str(term)) for term in group]
+        normalized = [term for term in normalized if term]
+        for term in normalized[1:]:
+            parent[find(term)] = find(normalized[0])
+        if normalized:
+            find(normalized[0])
+
+    members: dict[str, set[str]] = {}
+    for term in parent:
+        members.setdefault(find(term), set()).add(term)
+
+    groups: dict[str, AliasGroup] = {}
+    for terms in members.values():
+        patterns = tuple(sorted({"".join(search_tokens(term)) for term in terms} - {""}))
+        group = AliasGroup(terms=frozenset(terms), patterns=patterns)
+        for term in terms:
+            groups[term] = group
+    return groups
+
+
+_groups: dict[str, AliasGroup] = {}
+_loaded_mtime: float | None = None
+_checked_at = 0.0
+
+
+def reload_aliases(force: bool = False) -> None:
+    """Recompile the alias groups if the data file changed.
+
+    A malformed file keeps the previously loaded groups in place.
+    """
+    global _groups, _loaded_mtime, _checked_at
+
+    _checked_at = time.monotonic()
+    try:
+        mtime = SEARCH_ALIASES_FILE.stat().st_mtime
+        if not force and mtime == _loaded_mtime:
+            return
+        groups = compile_alias_groups(json.loads(SEARCH_ALIASES_FILE.read_text(encoding="utf-8")))
+    except (OSError, ValueError, TypeError) as exc:
+        print(f"[aliases] could not load {SEARCH_ALIASES_FILE}: {exc}")
+        return
+    _groups = groups
+    _loaded_mtime = mtime
+
+
+def _maybe_reload() -> None:
+    if time.monotonic() - _checked_at >= SEARCH_ALIASES_CHECK_SECONDS:
+        reload_aliases()
+
+
+def resolve_alias(normalized_term: str) -> AliasGroup | None:
+    """Return the alias group of an already-normalized term, if any."""
+    _maybe_reload()
+    return _groups.get(normalized_term)
+
+
+def alias_terms() -> list[str]:
+    """All normalized terms that belong to an alias group."""
+    _maybe_reload()
+    return list(_groups)
+
+
+reload_aliases(force=True)
@@ -0,0 +1,190 @@
+"""In-memory autocomplete for ``GET /products/autocomplete``.
+
+A compressed prefix (radix) trie is built over:
+
+  * every word-boundary suffix of each product title, normalized to its
+    ASCII-folded lowercase words without separators (``"Call of Duty"`` ->
+    ``callofduty``, ``ofduty``, ``duty``), so both single words and multi-word
+    prefixes ("call of d") complete;
+  * the search alias terms (see ``services.aliases``), which complete to the
+    products their alias group matches.
+
+Every node stores the top ``AUTOCOMPLETE_TOP_N`` product ids of its subtree,
+ranked by all-time sales, then ``calification``, then id, so a lookup is a
+walk of at most ``len(q)`` characters and never touches the database.
+
+The trie is built at startup and rebuilt in the background every
+``AUTOCOMPLETE_REFRESH_SECONDS`` from the catalog snapshot, the title index
+and the sales leaderboard.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.services.aliases import alias_terms, resolve_alias
+from app.services.catalog_cache import get_catalog_snapshot
+from app.services.leaderboard import get_ranking
+from app.services.search_index import refresh_title_index
+from app.util.search_text import search_tokens
+
+AUTOCOMPLETE_TOP_N = int(os.getenv("AUTOCOMPLETE_TOP_N", "10"))
+AUTOCOMPLETE_REFRESH_SECONDS = float(os.getenv("AUTOCOMPLETE_REFRESH_SECONDS", "300"))
+
+
+def autocomplete_key(text: str) -> str:
+    """Trie key for ``text``: its normalized words joined without separators."""
+    return "".join(search_tokens(text))
+
+
+class _Node:
+    __slots__ = ("label", "children", "product_ids", "top")
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.children: dict[str, _Node] = {}
+        self.product_ids: set[int] = set()
+        self.top: tuple[int, ...] = ()
+
+
+class AutocompleteTrie:
+    """Radix trie whose nodes carry a precomputed top-N of product ids."""
+
+    def __init__(self, top_n: int = AUTOCOMPLETE_TOP_N) -> None:
+        self.top_n = top_n
+        self._root = _Node("")
+
+    def insert(self, key: str, product_ids) -> None:
+        node, i = self._root, 0
+        while i < len(key):
+            child = node.children.get(key[i])
+            if child is None:
+                child = _Node(key[i:])
+                node.children[key[i]] = child
+                node = child
+                break
+            label = child.label
+            common = 0
+            while common < len(label) and i + common < len(key) and label[common] == key[i + common]:
+                common += 1
+            if common < len(label):
+                middle = _Node(label[:common])
+                child.label = label[common:]
+                middle.children[child.label[0]] = child
+                node.children[key[i]] = middle
+                child = middle
+            node = child
+            i += common
+        node.product_ids.update(product_ids)
+
+    def finalize(self, score) -> None:
+        """Compute every node's top-N, best ``score(product_id)`` first."""
+
+        def visit(node: _Node) -> set[int]:
+            candidates = set(node.product_ids)
+            for child in node.children.values():
+                candidates.update(visit(child))
+            node.top = tuple(heapq.nlargest(self.top_n, candidates, key=score))
+            return set(node.top)
+
+        visit(self._root)
+
+    def complete(self, prefix: str) -> tuple[int, ...]:
+        """Top product ids for keys starting with ``prefix``."""
+        if not prefix:
+            return ()
+        node, i = self._root, 0
+        while i < len(prefix):
+            child = node.children.get(prefix[i])
+            if child is None:
+                return ()
+            rest = prefix[i:]
+            if rest.startswith(child.label):
+                node = child
+                i += len(child.label)
+            elif child.label.startswith(rest):
+                return child.top
+            else:
+                return ()
+        return node.top
+
+
+_trie: AutocompleteTrie | None = None
+# product_id -> suggestion payload
+_suggestions: dict[int, dict] = {}
+_refresher: asyncio.Task | None = None
+
+
+def _build(
+    rows: list[dict], aliases: dict[str, list[int]], sales: dict[int, int]
+) -> tuple[AutocompleteTrie, dict[int, dict]]:
+    trie = AutocompleteTrie()
+    suggestions = {}
+    califications = {}
+    for row in rows:
+        product_id = row["id_product"]
+        words = search_tokens(row["title"] or "")
+        for start in range(len(words)):
+            trie.insert("".join(words[start:]), (product_id,))
+        suggestions[product_id] = {
+            "id_product": product_id,
+            "title": row["title"],
+            "image": row["image"],
+        }
+        califications[product_id] = row["calification"] or 0
+
+    for key, product_ids in aliases.items():
+        trie.insert(key, (pid for pid in product_ids if pid in suggestions))
+
+    trie.finalize(lambda pid: (sales.get(pid, 0), califications.get(pid, 0), -pid))
+    return trie, suggestions
+
+
+async def rebuild_autocomplete(session: AsyncSession) -> None:
+    """Rebuild the trie from the catalog snapshot, aliases and sales."""
+    global _trie, _suggestions
+
+    snapshot = await get_catalog_snapshot(session)
+    index = await refresh_title_index(session)
+    sales = dict(await get_ranking(session, "all"))
+
+    aliases = {}
+    for term in alias_terms():
+        group = resolve_alias(term)
+        key = autocomplete_key(term)
+        if group is not None and key:
+            aliases[key] = index.search_words(list(group.patterns))
+
+    # Building is pure CPU work; keep it off the event loop.
+    _trie, _suggestions = await asyncio.to_thread(_build, snapshot.data, aliases, sales)
+
+
+def autocomplete(q: str, limit: int = AUTOCOMPLETE_TOP_N) -> list[dict]:
+    """Suggestions (``id_product``, ``title``, ``image``) for the prefix ``q``."""
+    trie, suggestions = _trie, _suggestions
+    if trie is None:
+        return []
+    return [suggestions[pid] for pid in trie.complete(autocomplete_key(q))[:limit]]
+
+
+async def _refresh_periodically() -> None:
+    while True:
+        await asyncio.sleep(AUTOCOMPLETE_REFRESH_SECONDS)
+        try:
+            async with AsyncSessionLocal() as session:
+                await rebuild_autocomplete(session)
+        except Exception as exc:
+            print(f"[autocomplete] rebuild failed, keeping previous trie: {exc}")
+
+
+def start_autocomplete_refresher() -> None:
+    """Start the background rebuild loop (once per worker)."""
+    global _refresher
+
+    if _refresher is None or _refresher.done():
+        _refresher = asyncio.create_task(_refresh_periodically())
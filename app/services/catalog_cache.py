@@ -0,0 +1,317 @@
+"""In-process catalog snapshot.
+
+``GET /products/`` returns the whole catalog with prices on every call.  This
+module keeps a prebuilt copy of that listing per worker process:
+
+  * get_catalog_snapshot          – return the cached snapshot, rebuilding it
+                                    when missing, invalidated or older than
+                                    ``CATALOG_CACHE_TTL_SECONDS``.
+  * invalidate_catalog_snapshot   – drop the snapshot immediately.
+  * invalidate_catalog_on_commit  – drop the snapshot once the given session
+                                    commits (used by stock mutations so that a
+                                    concurrent rebuild cannot cache
+                                    uncommitted data).
+  * get_catalog_version           – catalog version string used to
+                                    build ETags for the catalog endpoints.
+
+Snapshots also memoize their serialized (and gzip/brotli compressed) JSON
+body, see ``CatalogSnapshot.encoded_body``.
+
+The cache is per worker: other workers pick up changes when their TTL
+expires.  Setting ``CATALOG_CACHE_TTL_SECONDS=0`` disables caching.
+
+``product_summary`` (prices, stock and consoles of the snapshot, listings
+and product detail) is kept in sync with this app's stock changes as they
+commit.  Edits made from Django are reconciled by
+``start_summary_refresher``: every ``PRODUCT_SUMMARY_REFRESH_SECONDS`` one
+worker recomputes the table and rewrites the rows that differ.  The same
+pass stores row checksums of the products, consoles and licences tables in
+``catalog_checksum``, which catalog versions read instead of scanning them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+
+from app.database import AsyncSessionLocal
+from app.models import CatalogChecksum, Consoles, Licenses, Product, ProductSummary
+from app.repositories.products import ProductRepository
+from app.util.after_commit import call_after_commit
+from app.util.compression import compress, compress_async
+
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "60"))
+CATALOG_VERSION_TTL_SECONDS = float(os.getenv("CATALOG_VERSION_TTL_SECONDS", "5"))
+PRODUCT_SUMMARY_REFRESH_SECONDS = float(os.getenv("PRODUCT_SUMMARY_REFRESH_SECONDS", "60"))
+
+# pg advisory lock key: one worker at a time reconciles product_summary.
+_SUMMARY_REFRESH_LOCK = 0x70726F64
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Serialized catalog rows ordered by ``id_product``."""
+
+    data: list[dict]
+    built_at: float
+    by_id: dict[int, dict] = field(init=False, repr=False, compare=False)
+    # encoding (None = identity) -> serialized ``{"data": data}``
+    _bodies: dict[str | None, bytes] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "by_id", {row["id_product"]: row for row in self.data})
+        object.__setattr__(self, "_bodies", {})
+
+    def encoded_body(self, encoding: str | None = None) -> bytes:
+        """``{"data": data}`` as JSON bytes, compressed with ``encoding``.
+
+        Serialized and compressed at most once per snapshot and encoding, so
+        hot catalog responses are never re-encoded.
+        """
+        body = self._bodies.get(encoding)
+        if body is None:
+            if encoding is None:
+                body = ORJSONResponse({"data": self.data}).body
+            else:
+                body = compress(self.encoded_body(), encoding)
+            self._bodies[encoding] = body
+        return body
+
+    async def encoded_body_async(self, encoding: str | None = None) -> bytes:
+        """``encoded_body``, compressing off the event loop the first time."""
+        if encoding is not None and encoding not in self._bodies:
+            body = await compress_async(self.encoded_body(), encoding)
+            self._bodies.setdefault(encoding, body)
+        return self.encoded_body(encoding)
+
+    def rows_for_ids(self, product_ids) -> list[dict]:
+        """Rows for ``product_ids`` in the given order, skipping unknown ids."""
+        return [self.by_id[pid] for pid in product_ids if pid in self.by_id]
+
+    def filter_by_ids(self, product_ids) -> list[dict]:
+        """Rows whose ``id_product`` is in ``product_ids``, in catalog order."""
+        wanted = set(product_ids)
+        return [row for row in self.data if row["id_product"] in wanted]
+
+
+_CATALOG_PRODUCTS = (
+    select(Product).options(noload(Product.consoles)).order_by(Product.id_product)
+)
+
+_snapshot: CatalogSnapshot | None = None
+# Bumped on every invalidation, i.e. every committed stock change in this worker.
+_generation = 0
+# (generation, fetched_at, version) of the last catalog version lookup.
+_version: tuple[int, float, str] | None = None
+_rebuild_lock = asyncio.Lock()
+_summary_refresher: asyncio.Task | None = None
+
+
+def _is_fresh(snapshot: CatalogSnapshot | None) -> bool:
+    return (
+        snapshot is not None
+        and time.monotonic() - snapshot.built_at < CATALOG_CACHE_TTL_SECONDS
+    )
+
+
+async def _build_snapshot(session: AsyncSession) -> CatalogSnapshot:
+    result = await session.execute(_CATALOG_PRODUCTS)
+    products = result.scalars().all()
+    prices = await ProductRepository.get_price_summaries(
+        session, [p.id_product for p in products]
+    )
+
+    data = [
+        {
+            "id_product": p.id_product,
+            "title": p.title,
+            "description": p.description,
+            "date_register": p.date_register,
+            "date_last_modified": p.date_last_modified,
+            "image": p.image,
+            "calification": p.calification,
+            "puntos_venta": p.puntos_venta,
+            "puede_rentarse": p.puede_rentarse,
+            "destacado": p.destacado,
+            "type_id": p.type_id_id,
+            "price": prices[p.id_product].min_price,
+            "price_discount": prices[p.id_product].min_discount_price,
+            "consoles": [
+                {"id_console": console_id}
+                for console_id in prices[p.id_product].console_ids
+            ],
+        }
+        for p in products
+    ]
+    return CatalogSnapshot(data=data, built_at=time.monotonic())
+
+
+async def get_catalog_snapshot(session: AsyncSession) -> CatalogSnapshot:
+    """Return the current catalog snapshot, rebuilding it if stale.
+
+    Concurrent callers share a single rebuild.  A snapshot whose build
+    overlapped an invalidation is returned to its caller but not stored.
+    """
+    global _snapshot
+
+    snapshot = _snapshot
+    if _is_fresh(snapshot):
+        return snapshot
+
+    async with _rebuild_lock:
+        snapshot = _snapshot
+        if _is_fresh(snapshot):
+            return snapshot
+
+        generation = _generation
+        snapshot = await _build_snapshot(session)
+        if generation == _generation and CATALOG_CACHE_TTL_SECONDS > 0:
+            _snapshot = snapshot
+        return snapshot
+
+
+def invalidate_catalog_snapshot() -> None:
+    """Drop the cached snapshot so the next read rebuilds it."""
+    global _snapshot, _generation
+
+    _generation += 1
+    _snapshot = None
+
+
+def invalidate_catalog_on_commit(session: AsyncSession) -> None:
+    """Invalidate the snapshot after ``session`` commits its current transaction."""
+    call_after_commit(session, "invalidate_catalog_snapshot", invalidate_catalog_snapshot)
+
+
+def _table_checksum(table):
+    """Order-independent checksum over every row of ``table``.
+
+    Sums a hash of each whole row (``table::text``), so inserting, deleting
+    or editing any column of any row changes it.
+    """
+    row_hash = func.hashtextextended(literal_column(f"{table.name}::text"), literal_column("0"))
+    return (
+        select(func.coalesce(func.sum(row_hash), literal_column("0")))
+        .select_from(table)
+        .scalar_subquery()
+    )
+
+
+# Django-edited tables whose changes product_summary does not reflect:
+# same-day product edits (date_last_modified has day granularity) and
+# console / licence renames.
+_CHECKSUM_TABLES = (Product.__table__, Consoles.__table__, Licenses.__table__)
+
+_CHECKSUMS = select(*(_table_checksum(table).label(table.name) for table in _CHECKSUM_TABLES))
+
+_CATALOG_VERSION = select(
+    func.max(Product.date_last_modified),
+    func.count(Product.id_product),
+    select(func.max(ProductSummary.updated_at)).scalar_subquery(),
+    select(func.max(CatalogChecksum.updated_at)).scalar_subquery(),
+)
+
+
+async def store_catalog_checksums(session: AsyncSession) -> int:
+    """Recompute the ``catalog_checksum`` rows; returns how many changed.
+
+    Scans the checksummed tables, so it only runs from the summary
+    refresher. Does NOT commit.
+    """
+    result = await session.execute(_CHECKSUMS)
+    stmt = pg_insert(CatalogChecksum).values([
+        {"table_name": name, "checksum": checksum, "updated_at": func.now()}
+        for name, checksum in result.one()._mapping.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CatalogChecksum.table_name],
+        set_={"checksum": stmt.excluded.checksum, "updated_at": stmt.excluded.updated_at},
+        where=CatalogChecksum.checksum.is_distinct_from(stmt.excluded.checksum),
+    )
+    return (await session.execute(stmt)).rowcount
+
+
+async def get_catalog_version(session: AsyncSession) -> str:
+    """Return a string that changes whenever the served catalog may change.
+
+    Combines the newest ``date_last_modified``, the product count (adds and
+    deletes), the newest ``product_summary.updated_at`` (stock changes, and
+    Django-side price / stock / console edits once reconciled) and the newest
+    ``catalog_checksum.updated_at`` (same-day product edits, console and
+    licence renames, see ``store_catalog_checksums``). All are cheap
+    aggregates; the lookup is still reused for
+    ``CATALOG_VERSION_TTL_SECONDS`` unless this worker committed a stock
+    change meanwhile.
+    """
+    global _version
+
+    cached = _version
+    if (
+        cached is not None
+        and cached[0] == _generation
+        and time.monotonic() - cached[1] < CATALOG_VERSION_TTL_SECONDS
+    ):
+        return cached[2]
+
+    generation = _generation
+    result = await session.execute(_CATALOG_VERSION)
+    version = ":".join(str(value) for value in result.one())
+    if cached is not None and cached[2] != version:
+        # Changed outside this worker (other workers, Django): rebuild the
+        # snapshot so the body sent with the new ETag reflects the change.
+        invalidate_catalog_snapshot()
+        generation = _generation
+    _version = (generation, time.monotonic(), version)
+    return version
+
+
+async def refresh_product_summaries() -> int:
+    """Reconcile ``product_summary`` and ``catalog_checksum`` with Django edits.
+
+    Skipped (returns 0) while another worker holds the refresh lock.
+    Returns the number of rows changed; the catalog snapshot is dropped
+    when there were any.
+    """
+    async with AsyncSessionLocal() as session:
+        locked = await session.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _SUMMARY_REFRESH_LOCK}
+        )
+        if not locked.scalar():
+            return 0
+        changed = await ProductRepository.refresh_summaries(session)
+        changed += await store_catalog_checksums(session)
+        await session.commit()
+    if changed:
+        invalidate_catalog_snapshot()
+    return changed
+
+
+async def _refresh_summaries_periodically() -> None:
+    while True:
+        try:
+            await refresh_product_summaries()
+        except Exception as exc:
+            print(f"[catalog] product_summary refresh failed: {exc}")
+        await asyncio.sleep(PRODUCT_SUMMARY_REFRESH_SECONDS)
+
+
+def start_summary_refresher() -> None:
+    """Start the product_summary reconcile loop (once per worker).
+
+    Runs right away (fills the table after a deploy), then every
+    ``PRODUCT_SUMMARY_REFRESH_SECONDS``; ``0`` disables it.
+    """
+    global _summary_refresher
+
+    if PRODUCT_SUMMARY_REFRESH_SECONDS <= 0:
+        return
+    if _summary_refresher is None or _summary_refresher.done():
+        _summary_refresher = asyncio.create_task(_refresh_summaries_periodically())
@@ -0,0 +1,144 @@
+"""Per-worker coupon directory: case-insensitive code -> coupon.
+
+``POST /products/coupon/{code}`` looks coupons up by
+``lower(name_coupon)``, which the unique index on ``name_coupon`` cannot
+serve; ``python -m app.cli ensure-coupon-code-index`` creates the matching
+expression index.  Checkout flows apply and re-apply the same few codes,
+so lookups are cached here, keyed by the lowercased code:
+
+  * a found coupon is kept for ``COUPON_CACHE_TTL_SECONDS``, but never past
+    its ``expiration_date``;
+  * an unknown, inactive or expired code is cached as a miss for
+    ``COUPON_NEGATIVE_TTL_SECONDS``;
+  * the whole directory is dropped when a coupon is created, modified or
+    deleted, detected with a cheap aggregate over ``coupons_coupon``
+    (``get_coupon_version``) checked at most every
+    ``COUPON_VERSION_TTL_SECONDS``.
+
+At most ``COUPON_CACHE_MAX`` codes are kept; expired entries are evicted
+first, then the oldest ones.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Coupon
+
+COUPON_CACHE_TTL_SECONDS = float(os.getenv("COUPON_CACHE_TTL_SECONDS", "60"))
+COUPON_NEGATIVE_TTL_SECONDS = float(os.getenv("COUPON_NEGATIVE_TTL_SECONDS", "30"))
+COUPON_VERSION_TTL_SECONDS = float(os.getenv("COUPON_VERSION_TTL_SECONDS", "5"))
+COUPON_CACHE_MAX = int(os.getenv("COUPON_CACHE_MAX", "4096"))
+
+
+@dataclass(frozen=True)
+class CouponEntry:
+    """The columns of a ``Coupon`` needed to validate it, detached from any session."""
+
+    id_coupon: int
+    name_coupon: str
+    modified_at: datetime | None
+    expiration_date: datetime
+    is_valid: bool
+    user_id: int | None
+    percentage_off: int
+    points_given: int
+
+    def is_active(self, now: datetime) -> bool:
+        return bool(self.is_valid) and _as_utc(self.expiration_date) > now
+
+
+_COUPON_BY_CODE = (
+    select(
+        Coupon.id_coupon,
+        Coupon.name_coupon,
+        Coupon.modified_at,
+        Coupon.expiration_date,
+        Coupon.is_valid,
+        Coupon.user_id,
+        Coupon.percentage_off,
+        Coupon.points_given,
+    )
+    .where(
+        func.lower(Coupon.name_coupon) == bindparam("code"),
+        Coupon.expiration_date > bindparam("now"),
+        Coupon.is_valid.is_(True),
+    )
+    .limit(1)
+)
+
+# code -> (entry or None for a miss, monotonic deadline), oldest first
+_entries: dict[str, tuple[CouponEntry | None, float]] = {}
+# (checked_at, version) of the last coupon version lookup
+_version: tuple[float, tuple] | None = None
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+async def get_coupon_version(session: AsyncSession) -> tuple:
+    """(count, max id, max modified_at) of ``coupons_coupon``; changes on any edit."""
+    result = await session.execute(
+        select(
+            func.count(Coupon.id_coupon),
+            func.max(Coupon.id_coupon),
+            func.max(Coupon.modified_at),
+        )
+    )
+    return tuple(result.one())
+
+
+async def _drop_if_changed(session: AsyncSession) -> None:
+    global _version
+
+    checked = _version
+    if checked is not None and time.monotonic() - checked[0] < COUPON_VERSION_TTL_SECONDS:
+        return
+    version = await get_coupon_version(session)
+    if checked is not None and version != checked[1]:
+        _entries.clear()
+    _version = (time.monotonic(), version)
+
+
+def _store(code: str, entry: CouponEntry | None, now: datetime) -> None:
+    ttl = COUPON_NEGATIVE_TTL_SECONDS
+    if entry is not None:
+        remaining = (_as_utc(entry.expiration_date) - now).total_seconds()
+        ttl = min(COUPON_CACHE_TTL_SECONDS, remaining)
+
+    deadline = time.monotonic() + ttl
+    _entries.pop(code, None)
+    if len(_entries) >= COUPON_CACHE_MAX:
+        clock = time.monotonic()
+        for stale in [key for key, (_, until) in _entries.items() if until <= clock]:
+            del _entries[stale]
+        while len(_entries) >= COUPON_CACHE_MAX:
+            del _entries[next(iter(_entries))]
+    _entries[code] = (entry, deadline)
+
+
+async def lookup_coupon(
+    session: AsyncSession, code: str, now: datetime | None = None
+) -> CouponEntry | None:
+    """The active (valid, not expired) coupon named ``code``, any case."""
+    now = now or datetime.now(timezone.utc)
+    code = code.lower()
+    await _drop_if_changed(session)
+
+    cached = _entries.get(code)
+    if cached is not None and time.monotonic() < cached[1]:
+        entry = cached[0]
+    else:
+        result = await session.execute(_COUPON_BY_CODE, {"code": code, "now": now})
+        row = result.first()
+        entry = CouponEntry(**row._mapping) if row is not None else None
+        _store(code, entry, now)
+
+    return entry if entry is not None and entry.is_active(now) else None
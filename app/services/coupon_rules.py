@@ -0,0 +1,427 @@
+"""Compiled coupon rules (``products_couponrule``).
+
+A coupon's rule rows are compiled once into a ``CouponRulePlan``: an
+ordered list of typed predicates, the in-memory cart checks first and the
+checks that need a count from the database last.  All the counts a plan
+needs are fetched in a single query, and only when every in-memory check
+passed.
+
+Rule values are validated while compiling: a rule whose JSON value does
+not have the shape its ``rule_type`` / ``operator`` expects raises
+``CouponRuleError``, and the coupon is then rejected as a whole (instead of
+failing with a ``TypeError`` halfway through a validation).  Unknown rule
+types and operators are ignored, as on the Django side.
+
+Plans are cached per worker and per ``id_coupon``, and recompiled when the
+coupon's ``modified_at`` changes or after ``COUPON_RULES_TTL_SECONDS`` (rule
+rows are edited from Django, which does not always touch the coupon).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import ClassVar
+
+from sqlalchemy import Select, bindparam, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import CouponRedemption, CouponRule, SaleDetail
+from app.services.coupon_directory import CouponEntry
+
+COUPON_RULES_TTL_SECONDS = float(os.getenv("COUPON_RULES_TTL_SECONDS", "300"))
+COUPON_RULE_PLANS_MAX = int(os.getenv("COUPON_RULE_PLANS_MAX", "1024"))
+
+INVALID_RULES_MESSAGE = "El cupón tiene reglas inválidas."
+
+_DAY_NAMES = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+
+
+class CouponRuleError(ValueError):
+    """A coupon rule whose value does not fit its rule type and operator."""
+
+
+@dataclass(frozen=True)
+class CartContext:
+    """The cart figures rules are evaluated against, computed once."""
+
+    user_id: int
+    coupon_id: int
+    total: float
+    quantity: int
+    categories: frozenset[int]
+    weekday: int
+
+
+def cart_context(coupon_id: int, user_id: int, cart_items, now: datetime) -> CartContext:
+    return CartContext(
+        user_id=user_id,
+        coupon_id=coupon_id,
+        total=sum(item.quantity * item.unit_price for item in cart_items),
+        quantity=sum(item.quantity for item in cart_items),
+        categories=frozenset(
+            item.category_id for item in cart_items if item.category_id is not None
+        ),
+        weekday=now.weekday(),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Predicates: ``check`` returns None when the rule passes, else the message.
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Reject:
+    message: str
+
+    def check(self, cart: CartContext) -> str | None:
+        return self.message
+
+
+@dataclass(frozen=True)
+class TotalAtLeast:
+    amount: float
+
+    def check(self, cart: CartContext) -> str | None:
+        if cart.total >= self.amount:
+            return None
+        return f"El monto mínimo de la orden debe ser {self.amount}."
+
+
+@dataclass(frozen=True)
+class TotalAtMost:
+    amount: float
+
+    def check(self, cart: CartContext) -> str | None:
+        if cart.total <= self.amount:
+            return None
+        return f"El monto máximo de la orden es {self.amount}."
+
+
+@dataclass(frozen=True)
+class TotalBetween:
+    low: float
+    high: float
+
+    def check(self, cart: CartContext) -> str | None:
+        if self.low <= cart.total <= self.high:
+            return None
+        return f"El monto de la orden debe estar entre {self.low} y {self.high}."
+
+
+@dataclass(frozen=True)
+class QuantityAtLeast:
+    quantity: float
+
+    def check(self, cart: CartContext) -> str | None:
+        if cart.quantity >= self.quantity:
+            return None
+        return f"Se requieren al menos {self.quantity} ítems en el carrito."
+
+
+@dataclass(frozen=True)
+class QuantityEquals:
+    quantity: float
+
+    def check(self, cart: CartContext) -> str | None:
+        if cart.quantity == self.quantity:
+            return None
+        return f"Se requieren exactamente {self.quantity} ítems en el carrito."
+
+
+@dataclass(frozen=True)
+class QuantityBetween:
+    low: float
+    high: float
+
+    def check(self, cart: CartContext) -> str | None:
+        if self.low <= cart.quantity <= self.high:
+            return None
+        return f"La cantidad de ítems debe estar entre {self.low} y {self.high}."
+
+
+@dataclass(frozen=True)
+class CategoryIn:
+    categories: frozenset[int]
+
+    def check(self, cart: CartContext) -> str | None:
+        if cart.categories & self.categories:
+            return None
+        return "Ningún ítem del carrito pertenece a las categorías permitidas."
+
+
+@dataclass(frozen=True)
+class WeekdayIn:
+    days: tuple[int, ...]
+
+    def check(self, cart: CartContext) -> str | None:
+        if cart.weekday in self.days:
+            return None
+        allowed_names = ", ".join(_DAY_NAMES[day] for day in self.days)
+        return f"El cupón solo es válido los siguientes días: {allowed_names}."
+
+
+# Counted predicates name the count they need (see ``_COUNTS``) and check it.
+
+
+@dataclass(frozen=True)
+class FirstPurchase:
+    counter: ClassVar[str] = "user_sales"
+
+    def check(self, count: int) -> str | None:
+        if count == 0:
+            return None
+        return "Este cupón es válido solo para la primera compra."
+
+
+@dataclass(frozen=True)
+class RedemptionsBelow:
+    limit: int
+    counter: ClassVar[str] = "coupon_redemptions"
+
+    def check(self, count: int) -> str | None:
+        if count < self.limit:
+            return None
+        return "El cupón ha alcanzado el límite máximo de usos."
+
+
+@dataclass(frozen=True)
+class UserRedemptionsBelow:
+    limit: int
+    counter: ClassVar[str] = "user_redemptions"
+
+    def check(self, count: int) -> str | None:
+        if count < self.limit:
+            return None
+        return "Has alcanzado el límite de usos de este cupón."
+
+
+_COUNTS = {
+    "user_sales": select(func.count(SaleDetail.id_sale_detail))
+    .where(SaleDetail.usuario_id == bindparam("user_id"))
+    .scalar_subquery(),
+    "coupon_redemptions": select(func.count(CouponRedemption.id))
+    .where(CouponRedemption.coupon_id == bindparam("coupon_id"))
+    .scalar_subquery(),
+    "user_redemptions": select(func.count(CouponRedemption.id))
+    .where(
+        CouponRedemption.coupon_id == bindparam("coupon_id"),
+        CouponRedemption.user_id == bindparam("user_id"),
+    )
+    .scalar_subquery(),
+}
+
+
+@lru_cache(maxsize=None)
+def _counts_statement(counters: tuple[str, ...]) -> Select:
+    """One SELECT returning every count in ``counters`` (one round trip)."""
+    return select(*(_COUNTS[name].label(name) for name in counters))
+
+
+# ---------------------------------------------------------------------------
+# Compiler
+# ---------------------------------------------------------------------------
+
+
+def _number(value, what: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise CouponRuleError(f"{what} must be a number, got {value!r}")
+    return value
+
+
+def _integer(value, what: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise CouponRuleError(f"{what} must be an integer, got {value!r}") from None
+
+
+def _mapping(value, what: str) -> dict:
+    if not isinstance(value, dict):
+        raise CouponRuleError(f"{what} must be an object, got {value!r}")
+    return value
+
+
+def _integer_list(value, what: str) -> list[int]:
+    if not isinstance(value, list) or any(
+        isinstance(v, bool) or not isinstance(v, int) for v in value
+    ):
+        raise CouponRuleError(f"{what} must be a list of integers, got {value!r}")
+    return value
+
+
+def compile_rule(rule_type: str, operator: str, value):
+    """The predicate for one rule row, or None when it never applies."""
+    rt = (rule_type or "").lower()
+    op = (operator or "").lower()
+    value = value if value is not None else {}
+    fields = value if isinstance(value, dict) else {}
+
+    if rt == "min_order_amount":
+        if op == "gte":
+            amount = fields.get("amount", value) if isinstance(value, dict) else value
+            return TotalAtLeast(_number(amount, "min_order_amount amount"))
+        if op == "between":
+            return TotalBetween(
+                _number(fields.get("min", 0), "min_order_amount min"),
+                _number(fields.get("max", float("inf")), "min_order_amount max"),
+            )
+
+    elif rt == "max_order_amount":
+        if op == "lte":
+            if not isinstance(value, (int, float)):
+                value = _mapping(value, "max_order_amount value").get("amount", float("inf"))
+            return TotalAtMost(_number(value, "max_order_amount amount"))
+        if op == "between":
+            value = _mapping(value, "max_order_amount value")
+            return TotalBetween(
+                _number(value.get("min", 0), "max_order_amount min"),
+                _number(value.get("max", float("inf")), "max_order_amount max"),
+            )
+
+    elif rt == "min_item_quantity":
+        quantity = fields.get("quantity", value) if isinstance(value, dict) else value
+        if op == "gte":
+            return QuantityAtLeast(_number(quantity, "min_item_quantity quantity"))
+        if op == "eq":
+            return QuantityEquals(_number(quantity, "min_item_quantity quantity"))
+        if op == "between":
+            return QuantityBetween(
+                _number(quantity, "min_item_quantity quantity"),
+                _number(fields.get("max", float("inf")), "min_item_quantity max"),
+            )
+
+    elif rt == "allowed_categories":
+        if op == "in":
+            value = _mapping(value, "allowed_categories value")
+            return CategoryIn(frozenset(
+                _integer_list(value.get("categories", []), "allowed_categories categories")
+            ))
+
+    elif rt == "day_of_week":
+        if op == "in":
+            value = _mapping(value, "day_of_week value")
+            days = _integer_list(value.get("days", []), "day_of_week days")  # 0=Monday … 6=Sunday
+            if any(not 0 <= day <= 6 for day in days):
+                raise CouponRuleError(f"day_of_week days must be between 0 and 6, got {days!r}")
+            return WeekdayIn(tuple(days))
+
+    elif rt == "first_purchase_only":
+        return FirstPurchase()
+
+    elif rt == "usage_limit_total":
+        limit = fields.get("limit", 0) if isinstance(value, dict) else value
+        if limit is None:
+            return None
+        if op not in ("lte", "eq"):
+            return Reject("El cupón ha alcanzado el límite máximo de usos.")
+        return RedemptionsBelow(_integer(limit, "usage_limit_total limit"))
+
+    elif rt == "usage_limit_per_user":
+        limit = fields.get("limit", 1) if isinstance(value, dict) else value
+        if limit is None:
+            return None
+        if op not in ("lte", "eq"):
+            return Reject("Has alcanzado el límite de usos de este cupón.")
+        return UserRedemptionsBelow(_integer(limit, "usage_limit_per_user limit"))
+
+    # Unknown / unhandled rule type or operator: never applies (Django fallback).
+    return None
+
+
+@dataclass(frozen=True)
+class CouponRulePlan:
+    """A coupon's compiled rules; see ``evaluate``."""
+
+    checks: tuple
+    counted: tuple
+    modified_at: datetime | None
+    compiled_at: float
+    error: str | None = None
+
+    async def evaluate(self, session: AsyncSession, cart: CartContext) -> str | None:
+        """None when every rule passes, else the first failure's message."""
+        if self.error is not None:
+            return INVALID_RULES_MESSAGE
+        for predicate in self.checks:
+            message = predicate.check(cart)
+            if message is not None:
+                return message
+        if not self.counted:
+            return None
+
+        counters = tuple(dict.fromkeys(predicate.counter for predicate in self.counted))
+        result = await session.execute(
+            _counts_statement(counters),
+            {"user_id": cart.user_id, "coupon_id": cart.coupon_id},
+        )
+        counts = result.one()._mapping
+        for predicate in self.counted:
+            message = predicate.check(counts[predicate.counter] or 0)
+            if message is not None:
+                return message
+        return None
+
+
+def compile_rules(rules, modified_at: datetime | None = None) -> CouponRulePlan:
+    """Compile ``(rule_type, operator, value)`` rows; raises CouponRuleError."""
+    checks, counted = [], []
+    for rule_type, operator, value in rules:
+        predicate = compile_rule(rule_type, operator, value)
+        if predicate is None:
+            continue
+        (counted if hasattr(predicate, "counter") else checks).append(predicate)
+    return CouponRulePlan(
+        checks=tuple(checks),
+        counted=tuple(counted),
+        modified_at=modified_at,
+        compiled_at=time.monotonic(),
+    )
+
+
+_RULES_BY_COUPON_ID = (
+    select(CouponRule.rule_type, CouponRule.operator, CouponRule.value)
+    .where(CouponRule.coupon_id == bindparam("coupon_id"))
+    .order_by(CouponRule.id)
+)
+
+# id_coupon -> plan, oldest first
+_plans: dict[int, CouponRulePlan] = {}
+
+
+def _is_current(plan: CouponRulePlan | None, coupon: CouponEntry) -> bool:
+    return (
+        plan is not None
+        and plan.modified_at == coupon.modified_at
+        and time.monotonic() - plan.compiled_at < COUPON_RULES_TTL_SECONDS
+    )
+
+
+async def get_rule_plan(session: AsyncSession, coupon: CouponEntry) -> CouponRulePlan:
+    """The compiled rules of ``coupon``, compiling them on a cache miss."""
+    plan = _plans.get(coupon.id_coupon)
+    if _is_current(plan, coupon):
+        return plan
+
+    result = await session.execute(_RULES_BY_COUPON_ID, {"coupon_id": coupon.id_coupon})
+    try:
+        plan = compile_rules(result.all(), coupon.modified_at)
+    except CouponRuleError as exc:
+        print(f"[coupon-rules] coupon {coupon.id_coupon} rejected: {exc}")
+        plan = CouponRulePlan(
+            checks=(),
+            counted=(),
+            modified_at=coupon.modified_at,
+            compiled_at=time.monotonic(),
+            error=str(exc),
+        )
+
+    _plans.pop(coupon.id_coupon, None)
+    while len(_plans) >= COUPON_RULE_PLANS_MAX:
+        del _plans[next(iter(_plans))]
+    _plans[coupon.id_coupon] = plan
+    return plan
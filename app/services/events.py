@@ -0,0 +1,96 @@
+"""In-process pub/sub for stock change events.
+
+The order lifecycle hooks publish ``{"product_id", "game_detail_id",
+"stock"}`` events once their transaction commits; ``/products/stream``
+relays them to Server-Sent Events subscribers.
+
+Each subscriber owns a bounded queue (``STOCK_EVENTS_QUEUE_SIZE``).  A
+subscriber that falls behind and fills its queue is dropped: its pending
+events are discarded and its stream is ended, so one stale client can never
+hold memory or slow down publishers.
+
+The bus is per worker process: subscribers only see changes committed by the
+worker they are connected to.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import GameDetail
+from app.util.after_commit import call_after_commit
+
+STOCK_EVENTS_QUEUE_SIZE = int(os.getenv("STOCK_EVENTS_QUEUE_SIZE", "100"))
+
+
+class Subscription:
+    """A subscriber's bounded event queue plus its product filter."""
+
+    def __init__(self, product_ids: Iterable[int] | None, maxsize: int) -> None:
+        self.product_ids = frozenset(product_ids) if product_ids else None
+        self.queue: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def wants(self, event: dict) -> bool:
+        return self.product_ids is None or event["product_id"] in self.product_ids
+
+    async def get(self) -> dict | None:
+        """Next event, or None once the subscriber has been dropped."""
+        return await self.queue.get()
+
+
+class EventBus:
+
+    def __init__(self, queue_size: int) -> None:
+        self._queue_size = queue_size
+        self._subscriptions: set[Subscription] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    @contextmanager
+    def subscribe(self, product_ids: Iterable[int] | None = None) -> Iterator[Subscription]:
+        subscription = Subscription(product_ids, self._queue_size)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event: dict) -> None:
+        for subscription in list(self._subscriptions):
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+        subscription.dropped = True
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+
+stock_events = EventBus(STOCK_EVENTS_QUEUE_SIZE)
+
+
+def publish_stock_change_on_commit(session: AsyncSession, game_detail: GameDetail) -> None:
+    """Publish ``game_detail``'s new stock once ``session`` commits."""
+    event = {
+        "product_id": game_detail.producto_id,
+        "game_detail_id": game_detail.id_game_detail,
+        "stock": game_detail.stock,
+    }
+    call_after_commit(
+        session,
+        f"stock_event:{game_detail.id_game_detail}",
+        lambda: stock_events.publish(event),
+    )
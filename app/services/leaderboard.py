@@ -0,0 +1,212 @@
+"""Precomputed most-sold leaderboard.
+
+Sales are counted per product in two FastAPI-managed tables:
+
+  * ``product_sales_total`` – all-time counter per product;
+  * ``product_sales_daily`` – per-day (UTC) buckets backing the rolling
+                              7 and 30 day windows.
+
+``record_sale`` increments both inside the caller's transaction whenever a
+SaleDetail is created; ``rebuild_leaderboard`` recomputes them from
+``products_saledetail`` (keeping only the buckets the windows need).
+
+On startup ``bootstrap_leaderboard`` fills the counters from
+``products_saledetail`` when they are still empty (first deploy); until
+they are filled, rankings are aggregated from ``products_saledetail``
+directly.  ``start_leaderboard_maintenance`` prunes the day buckets older
+than the longest window every ``LEADERBOARD_MAINTENANCE_SECONDS`` (one
+worker at a time).
+
+Rankings are read with ``get_ranking`` and cached per worker for
+``LEADERBOARD_TTL_SECONDS``; a committed sale drops the cached rankings.
+Products that no longer exist are left out of the rankings.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, exists, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.models import Product, ProductSalesDaily, ProductSalesTotal, SaleDetail
+from app.util.after_commit import call_after_commit
+
+LEADERBOARD_TTL_SECONDS = float(os.getenv("LEADERBOARD_TTL_SECONDS", "60"))
+LEADERBOARD_MAINTENANCE_SECONDS = float(os.getenv("LEADERBOARD_MAINTENANCE_SECONDS", "3600"))
+
+# pg advisory lock key: one worker at a time bootstraps / prunes the counters.
+_MAINTENANCE_LOCK = 0x6C656164
+
+# window name -> number of days (None = all time)
+WINDOWS: dict[str, int | None] = {"all": None, "7d": 7, "30d": 30}
+_MAX_WINDOW_DAYS = max(days for days in WINDOWS.values() if days)
+
+# window -> (built_at, [(product_id, sales), ...] ordered by sales desc, id asc)
+_rankings: dict[str, tuple[float, list[tuple[int, int]]]] = {}
+_ranking_lock = asyncio.Lock()
+_maintenance: asyncio.Task | None = None
+
+
+def _utc_day(value: datetime) -> date:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def invalidate_rankings() -> None:
+    _rankings.clear()
+
+
+async def record_sale(session: AsyncSession, product_id: int, sold_at: datetime) -> None:
+    """Count one sale of ``product_id``. Does NOT commit."""
+    total = pg_insert(ProductSalesTotal).values(product_id=product_id, sales=1)
+    await session.execute(
+        total.on_conflict_do_update(
+            index_elements=[ProductSalesTotal.product_id],
+            set_={"sales": ProductSalesTotal.sales + 1},
+        )
+    )
+    daily = pg_insert(ProductSalesDaily).values(
+        product_id=product_id, day=_utc_day(sold_at), sales=1
+    )
+    await session.execute(
+        daily.on_conflict_do_update(
+            index_elements=[ProductSalesDaily.product_id, ProductSalesDaily.day],
+            set_={"sales": ProductSalesDaily.sales + 1},
+        )
+    )
+    call_after_commit(session, "invalidate_rankings", invalidate_rankings)
+
+
+def _sale_day():
+    return func.date(func.timezone("UTC", SaleDetail.fecha_venta))
+
+
+def _bucket_cutoff() -> date:
+    """Oldest day bucket any window still needs."""
+    return datetime.now(timezone.utc).date() - timedelta(days=_MAX_WINDOW_DAYS)
+
+
+async def rebuild_leaderboard(session: AsyncSession) -> None:
+    """Recompute the counters from SaleDetail. Does NOT commit."""
+    sale_day = _sale_day()
+    cutoff = _bucket_cutoff()
+
+    await session.execute(delete(ProductSalesTotal))
+    await session.execute(delete(ProductSalesDaily))
+    await session.execute(
+        pg_insert(ProductSalesTotal).from_select(
+            ["product_id", "sales"],
+            select(SaleDetail.producto_id, func.count(SaleDetail.id_sale_detail))
+            .where(SaleDetail.producto_id.is_not(None))
+            .group_by(SaleDetail.producto_id),
+        )
+    )
+    await session.execute(
+        pg_insert(ProductSalesDaily).from_select(
+            ["product_id", "day", "sales"],
+            select(SaleDetail.producto_id, sale_day, func.count(SaleDetail.id_sale_detail))
+            .where(SaleDetail.producto_id.is_not(None), sale_day >= cutoff)
+            .group_by(SaleDetail.producto_id, sale_day),
+        )
+    )
+    call_after_commit(session, "invalidate_rankings", invalidate_rankings)
+
+
+async def prune_daily_buckets(session: AsyncSession) -> int:
+    """Delete day buckets older than the longest window. Does NOT commit."""
+    result = await session.execute(
+        delete(ProductSalesDaily).where(ProductSalesDaily.day < _bucket_cutoff())
+    )
+    return result.rowcount
+
+
+async def _counters_filled(session: AsyncSession) -> bool:
+    return bool(await session.scalar(select(exists().select_from(ProductSalesTotal))))
+
+
+async def bootstrap_leaderboard(session: AsyncSession) -> None:
+    """Fill the counters from SaleDetail if they are still empty. Commits.
+
+    Meant for startup, before the worker records any sale: workers wait for
+    each other on an advisory lock, so only the first one rebuilds.
+    """
+    await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MAINTENANCE_LOCK})
+    if not await _counters_filled(session):
+        await rebuild_leaderboard(session)
+        print("[leaderboard] counters bootstrapped from products_saledetail")
+    await session.commit()
+
+
+async def _prune_periodically() -> None:
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                locked = await session.execute(
+                    text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _MAINTENANCE_LOCK}
+                )
+                if locked.scalar():
+                    pruned = await prune_daily_buckets(session)
+                    await session.commit()
+                    if pruned:
+                        print(f"[leaderboard] pruned {pruned} expired day buckets")
+        except Exception as exc:
+            print(f"[leaderboard] pruning failed: {exc}")
+        await asyncio.sleep(LEADERBOARD_MAINTENANCE_SECONDS)
+
+
+def start_leaderboard_maintenance() -> None:
+    """Start the day bucket pruning loop (once per worker)."""
+    global _maintenance
+
+    if _maintenance is None or _maintenance.done():
+        _maintenance = asyncio.create_task(_prune_periodically())
+
+
+async def _load_ranking(session: AsyncSession, window: str) -> list[tuple[int, int]]:
+    days = WINDOWS[window]
+    since = None if days is None else datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    if not await _counters_filled(session):
+        # Not bootstrapped yet: aggregate the sales directly.
+        sales = func.count(SaleDetail.id_sale_detail)
+        product_id = SaleDetail.producto_id
+        query = select(product_id, sales).group_by(product_id)
+        if since is not None:
+            query = query.where(_sale_day() >= since)
+    elif since is None:
+        sales = ProductSalesTotal.sales
+        query = select(ProductSalesTotal.product_id, sales).where(sales > 0)
+        product_id = ProductSalesTotal.product_id
+    else:
+        sales = func.sum(ProductSalesDaily.sales)
+        product_id = ProductSalesDaily.product_id
+        query = (
+            select(product_id, sales)
+            .where(ProductSalesDaily.day >= since)
+            .group_by(product_id)
+        )
+    # Only products that still exist, so pages are never short.
+    query = query.join(Product, Product.id_product == product_id)
+    result = await session.execute(query.order_by(sales.desc(), product_id))
+    return [(pid, int(count)) for pid, count in result.all()]
+
+
+async def get_ranking(session: AsyncSession, window: str = "all") -> list[tuple[int, int]]:
+    """``[(product_id, sales), ...]`` for ``window``, most sold first (ties by id)."""
+    cached = _rankings.get(window)
+    if cached is not None and time.monotonic() - cached[0] < LEADERBOARD_TTL_SECONDS:
+        return cached[1]
+
+    async with _ranking_lock:
+        cached = _rankings.get(window)
+        if cached is not None and time.monotonic() - cached[0] < LEADERBOARD_TTL_SECONDS:
+            return cached[1]
+        ranking = await _load_ranking(session, window)
+        _rankings[window] = (time.monotonic(), ranking)
+        return ranking
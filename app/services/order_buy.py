@@ -7,6 +7,10 @@ order's life:
   * on_status_transition  – create SaleDetail on "Completado";
                             restore stock on "Cancelado".
 
+Stock changes also refresh the product's ``product_summary`` row in the same
+transaction and schedule an invalidation of the in-process catalog snapshot
+(``app.services.catalog_cache``) for when the caller commits.
+
 All functions receive an open ``AsyncSession`` and add their changes to the
 session WITHOUT committing.  The caller is responsible for committing (or
 rolling back) the whole unit of work.
@@ -21,6 +25,10 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import GameDetail, OrderBuy, SaleDetail
+from app.repositories.products import ProductRepository
+from app.services.catalog_cache import invalidate_catalog_on_commit
+from app.services.events import publish_stock_change_on_commit
+from app.services.leaderboard import record_sale
 
 # Status string constants kept in one place.
 STATUS_COMPLETADO = "completed"
@@ -76,9 +84,11 @@ async def _sale_detail_exists(
 # ---------------------------------------------------------------------------
 
 
-async def decrease_stock(session: AsyncSession, order: OrderBuy) -> None:
+async def decrease_stock(session: AsyncSession, order: OrderBuy) -> GameDetail:
     """Validate stock availability and decrement it by 1 for the order.
 
+    Returns the updated GameDetail.
+
     Must be called within the same database transaction as the order creation
     so that a validation failure here causes the whole operation to be rolled
     back by the caller.
@@ -105,13 +115,17 @@ async def decrease_stock(session: AsyncSession, order: OrderBuy) -> None:
         )
     game_detail.stock -= 1
     session.add(game_detail)
+    await ProductRepository.refresh_summaries(session, [game_detail.producto_id])
+    invalidate_catalog_on_commit(session)
+    return game_detail
 
 
-async def restore_stock(session: AsyncSession, order: OrderBuy) -> None:
+async def restore_stock(session: AsyncSession, order: OrderBuy) -> GameDetail | None:
     """Restore stock by 1 for the GameDetail that matches the order.
 
     Silently skips if no matching GameDetail is found so that cancellations
     on orders with an incomplete/missing variant do not crash the endpoint.
+    Returns the updated GameDetail, or None when nothing was restored.
     """
     game_detail = await _get_game_detail(
         session, order.product_id, order.id_license, order.id_console
@@ -119,6 +133,9 @@ async def restore_stock(session: AsyncSession, order: OrderBuy) -> None:
     if game_detail is not None:
         game_detail.stock += 1
         session.add(game_detail)
+        await ProductRepository.refresh_summaries(session, [game_detail.producto_id])
+        invalidate_catalog_on_commit(session)
+    return game_detail
 
 
 # ---------------------------------------------------------------------------
@@ -133,6 +150,8 @@ async def create_sale_detail(session: AsyncSession, order: OrderBuy) -> None:
     combination the function returns without creating a duplicate.  This
     guards against repeated calls when an order's status is set to
     "Completado" more than once.
+
+    New sales are also counted in the most-sold leaderboard.
     """
     game_detail = await _get_game_detail(
         session, order.product_id, order.id_license, order.id_console
@@ -152,6 +171,7 @@ async def create_sale_detail(session: AsyncSession, order: OrderBuy) -> None:
         cuenta_id=game_detail.cuenta_id if game_detail is not None else None,
     )
     session.add(sale)
+    await record_sale(session, sale.producto_id, sale.fecha_venta)
 
 
 # ---------------------------------------------------------------------------
@@ -163,11 +183,13 @@ async def on_order_created(session: AsyncSession, order: OrderBuy) -> None:
     """Side-effects to execute atomically with a new order's INSERT.
 
     * Validates and decrements GameDetail stock for each item in the order.
+    * Publishes the new stock on the stock event bus once committed.
 
     The function only *adds* changes to the session; the caller must commit
     (or rollback on failure) the whole unit of work.
     """
-    await decrease_stock(session, order)
+    game_detail = await decrease_stock(session, order)
+    publish_stock_change_on_commit(session, game_detail)
 
 
 async def on_status_transition(
@@ -178,7 +200,8 @@ async def on_status_transition(
     """Side-effects to execute when an order's status changes.
 
     * "Completado": creates a SaleDetail record (idempotent).
-    * "Cancelado":  restores the GameDetail stock (only on first transition).
+    * "Cancelado":  restores the GameDetail stock (only on first transition)
+                    and publishes it on the stock event bus once committed.
 
     *IMPORTANT*: this function reads ``order.status`` as the *previous* status
     to detect a genuine transition.  It must be called BEFORE ``order.status``
@@ -193,4 +216,6 @@ async def on_status_transition(
         await create_sale_detail(session, order)
 
     if new_status == STATUS_CANCELADO and previous_status != STATUS_CANCELADO:
-        await restore_stock(session, order)
+        game_detail = await restore_stock(session, order)
+        if game_detail is not None:
+            publish_stock_change_on_commit(session, game_detail)
@@ -0,0 +1,167 @@
+"""Item-to-item recommendations for ``/products/{id_product}/related``.
+
+Every user is a sparse vector over products:
+
+  * a purchase (any ``products_saledetail`` row)  weighs ``RECOMMENDATIONS_PURCHASE_WEIGHT``;
+  * a like (``user_liked_games``)                 weighs ``RECOMMENDATIONS_LIKE_WEIGHT``;
+
+(both add up when a user bought and liked the same product).  Transposed,
+each product is a sparse vector over users, and two products are related by
+the cosine of those vectors.  Dot products are accumulated user by user, so
+only pairs of products that actually share a user are ever touched.  Users
+with more than ``RECOMMENDATIONS_MAX_USER_ITEMS`` products are skipped: they
+add little signal and cost quadratic time.
+
+``rebuild_recommendations`` (``python -m app.cli rebuild-recommendations``)
+stores the best ``RECOMMENDATIONS_TOP_K`` neighbours of each product in
+``product_related``.  ``get_related_ids`` serves them from a per-worker copy
+of that table, reloaded every ``RECOMMENDATIONS_TTL_SECONDS``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import math
+import os
+import time
+from collections import defaultdict
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import LikedGame, ProductRelated, SaleDetail
+from app.util.after_commit import call_after_commit
+
+RECOMMENDATIONS_TOP_K = int(os.getenv("RECOMMENDATIONS_TOP_K", "20"))
+RECOMMENDATIONS_PURCHASE_WEIGHT = float(os.getenv("RECOMMENDATIONS_PURCHASE_WEIGHT", "1.0"))
+RECOMMENDATIONS_LIKE_WEIGHT = float(os.getenv("RECOMMENDATIONS_LIKE_WEIGHT", "0.5"))
+RECOMMENDATIONS_MAX_USER_ITEMS = int(os.getenv("RECOMMENDATIONS_MAX_USER_ITEMS", "200"))
+RECOMMENDATIONS_TTL_SECONDS = float(os.getenv("RECOMMENDATIONS_TTL_SECONDS", "300"))
+
+_INSERT_BATCH_SIZE = 1000
+
+# (loaded_at, product_id -> related ids best first)
+_neighbors: tuple[float, dict[int, tuple[int, ...]]] | None = None
+_load_lock = asyncio.Lock()
+
+
+def invalidate_neighbors() -> None:
+    global _neighbors
+
+    _neighbors = None
+
+
+def compute_neighbors(
+    interactions: dict[int, dict[int, float]], top_k: int
+) -> dict[int, list[tuple[int, float]]]:
+    """Top-``top_k`` cosine neighbours per product.
+
+    ``interactions`` maps user -> {product_id: weight}.  Returns
+    product_id -> [(related_id, score), ...] ordered by score desc, id asc.
+    """
+    norms: dict[int, float] = defaultdict(float)
+    dots: dict[int, dict[int, float]] = defaultdict(lambda: defaultdict(float))
+
+    for items in interactions.values():
+        for product_id, weight in items.items():
+            norms[product_id] += weight * weight
+        if len(items) > RECOMMENDATIONS_MAX_USER_ITEMS:
+            continue
+        pairs = sorted(items.items())
+        for i, (a, wa) in enumerate(pairs):
+            row = dots[a]
+            for b, wb in pairs[i + 1:]:
+                row[b] += wa * wb
+
+    # dots only holds a < b; mirror it while scoring.
+    scored: dict[int, list[tuple[float, int]]] = defaultdict(list)
+    for a, row in dots.items():
+        norm_a = math.sqrt(norms[a])
+        for b, dot in row.items():
+            score = dot / (norm_a * math.sqrt(norms[b]))
+            scored[a].append((score, b))
+            scored[b].append((score, a))
+
+    return {
+        product_id: [
+            (related_id, score)
+            for score, related_id in heapq.nsmallest(
+                top_k, candidates, key=lambda c: (-c[0], c[1])
+            )
+        ]
+        for product_id, candidates in scored.items()
+    }
+
+
+async def _load_interactions(session: AsyncSession) -> dict[int, dict[int, float]]:
+    interactions: dict[int, dict[int, float]] = defaultdict(dict)
+
+    purchases = await session.execute(
+        select(SaleDetail.usuario_id, SaleDetail.producto_id)
+        .where(SaleDetail.usuario_id.is_not(None), SaleDetail.producto_id.is_not(None))
+        .distinct()
+    )
+    for user_id, product_id in purchases.all():
+        interactions[user_id][product_id] = RECOMMENDATIONS_PURCHASE_WEIGHT
+
+    likes = await session.execute(
+        select(LikedGame.user_id, LikedGame.product_id).distinct()
+    )
+    for user_id, product_id in likes.all():
+        items = interactions[user_id]
+        items[product_id] = items.get(product_id, 0.0) + RECOMMENDATIONS_LIKE_WEIGHT
+
+    return interactions
+
+
+async def rebuild_recommendations(session: AsyncSession) -> int:
+    """Recompute ``product_related``. Does NOT commit.
+
+    Returns the number of products that got neighbours.
+    """
+    interactions = await _load_interactions(session)
+    neighbors = compute_neighbors(interactions, RECOMMENDATIONS_TOP_K)
+
+    await session.execute(delete(ProductRelated))
+    rows = [
+        {
+            "product_id": product_id,
+            "related_ids": [related_id for related_id, _ in related],
+            "scores": [round(score, 6) for _, score in related],
+        }
+        for product_id, related in sorted(neighbors.items())
+    ]
+    for start in range(0, len(rows), _INSERT_BATCH_SIZE):
+        await session.execute(
+            ProductRelated.__table__.insert(), rows[start:start + _INSERT_BATCH_SIZE]
+        )
+    call_after_commit(session, "invalidate_neighbors", invalidate_neighbors)
+    return len(rows)
+
+
+def _is_fresh(neighbors) -> bool:
+    return (
+        neighbors is not None
+        and time.monotonic() - neighbors[0] < RECOMMENDATIONS_TTL_SECONDS
+    )
+
+
+async def get_related_ids(session: AsyncSession, product_id: int) -> tuple[int, ...]:
+    """Precomputed related product ids for ``product_id``, best first."""
+    global _neighbors
+
+    neighbors = _neighbors
+    if not _is_fresh(neighbors):
+        async with _load_lock:
+            neighbors = _neighbors
+            if not _is_fresh(neighbors):
+                result = await session.execute(
+                    select(ProductRelated.product_id, ProductRelated.related_ids)
+                )
+                neighbors = (
+                    time.monotonic(),
+                    {pid: tuple(related) for pid, related in result.all()},
+                )
+                _neighbors = neighbors
+    return neighbors[1].get(product_id, ())
@@ -0,0 +1,373 @@
+"""In-memory trigram index over product titles.
+
+Titles are normalized with ``normalize_search_text`` (ASCII-folded, lowercase,
+no spaces) and split into trigram postings.  A substring query is resolved by
+intersecting the postings of its trigrams and verifying the candidates, so
+searches never scan ``products_products`` and only the matching rows are
+hydrated from the database.
+
+Search alias terms (see ``services.aliases``) are matched on whole title
+words instead (``search_words``): an alias pattern must be spelled out by a
+run of consecutive words, so "callofduty" matches "Call of Duty" while a
+short key such as "cod" does not match inside "Codename".
+
+For typo tolerance the index also keeps the distinct title words
+(``search_tokens``) with padded bigram postings.  ``fuzzy_search`` finds words
+within a small Levenshtein distance of each query word: the bigram count
+filter (a word within distance ``k`` shares all but at most ``2k`` of the
+query's distinct bigrams) yields a short candidate list, which is then
+verified with a bounded edit distance.  Unlike a BK-tree, the work does not
+grow with the distances between unrelated vocabulary words, so worst-case
+queries stay in the low milliseconds.
+
+The index is built at startup (``refresh_title_index``) and refreshed
+incrementally every ``SEARCH_INDEX_REFRESH_SECONDS``: new products and
+products whose ``date_last_modified`` is recent are re-indexed, and a full
+rebuild is triggered when the row count no longer matches (deletions).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Product
+from app.services.aliases import resolve_alias
+from app.util.search_text import normalize_search_text, search_tokens
+
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "60"))
+# Query words shorter than this must match a title word exactly.
+SEARCH_FUZZY_MIN_WORD_LENGTH = int(os.getenv("SEARCH_FUZZY_MIN_WORD_LENGTH", "4"))
+# Query words at least this long may be two edits away (otherwise one).
+SEARCH_FUZZY_TWO_EDITS_LENGTH = int(os.getenv("SEARCH_FUZZY_TWO_EDITS_LENGTH", "8"))
+# /products/search falls back to fuzzy matches below this many exact matches.
+SEARCH_FUZZY_MIN_RESULTS = int(os.getenv("SEARCH_FUZZY_MIN_RESULTS", "5"))
+
+_GRAM = 3
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + _GRAM] for i in range(len(text) - _GRAM + 1)}
+
+
+def _bigrams(word: str) -> set[str]:
+    padded = f"^{word}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _word_run_start(words: tuple[str, ...], pattern: str) -> int:
+    """Offset (in the joined words) of a run of ``words`` spelling ``pattern``, or -1."""
+    offset = 0
+    for start, word in enumerate(words):
+        end = 0
+        for following in words[start:]:
+            if not pattern.startswith(following, end):
+                break
+            end += len(following)
+            if end == len(pattern):
+                return offset
+        offset += len(word)
+    return -1
+
+
+def _bounded_levenshtein(a: str, b: str, bound: int) -> int:
+    """Levenshtein distance of ``a`` and ``b``, or ``bound + 1`` if larger."""
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            current.append(cost)
+            if cost < row_min:
+                row_min = cost
+        if row_min > bound:
+            return bound + 1
+        previous = current
+    return previous[-1]
+
+
+def _max_edits(word: str) -> int:
+    if len(word) < SEARCH_FUZZY_MIN_WORD_LENGTH:
+        return 0
+    return 2 if len(word) >= SEARCH_FUZZY_TWO_EDITS_LENGTH else 1
+
+
+class TitleSearchIndex:
+    """Trigram postings over normalized product titles."""
+
+    def __init__(self) -> None:
+        self._titles: dict[int, str] = {}
+        self._postings: dict[str, set[int]] = defaultdict(set)
+        # fuzzy matching: product -> title words, word -> products, bigram -> words
+        self._product_words: dict[int, frozenset[str]] = {}
+        # whole-word matching: product -> title words in order
+        self._title_words: dict[int, tuple[str, ...]] = {}
+        self._word_products: dict[str, set[int]] = defaultdict(set)
+        self._word_postings: dict[str, set[str]] = defaultdict(set)
+        self.max_id = 0
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def add(self, product_id: int, title: str | None) -> None:
+        """Index (or re-index) a product title."""
+        self.remove(product_id)
+        normalized = normalize_search_text(title or "")
+        self._titles[product_id] = normalized
+        for gram in _trigrams(normalized):
+            self._postings[gram].add(product_id)
+        ordered = tuple(search_tokens(title or ""))
+        self._title_words[product_id] = ordered
+        words = frozenset(ordered)
+        self._product_words[product_id] = words
+        for word in words:
+            if not self._word_products[word]:
+                for gram in _bigrams(word):
+                    self._word_postings[gram].add(word)
+            self._word_products[word].add(product_id)
+        self.max_id = max(self.max_id, product_id)
+
+    def remove(self, product_id: int) -> None:
+        normalized = self._titles.pop(product_id, None)
+        if normalized is None:
+            return
+        for gram in _trigrams(normalized):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._postings[gram]
+        self._title_words.pop(product_id, None)
+        for word in self._product_words.pop(product_id, ()):
+            products = self._word_products[word]
+            products.discard(product_id)
+            if products:
+                continue
+            del self._word_products[word]
+            for gram in _bigrams(word):
+                words = self._word_postings[gram]
+                words.discard(word)
+                if not words:
+                    del self._word_postings[gram]
+
+    def clear(self) -> None:
+        self._titles.clear()
+        self._postings.clear()
+        self._product_words.clear()
+        self._title_words.clear()
+        self._word_products.clear()
+        self._word_postings.clear()
+        self.max_id = 0
+
+    def title(self, product_id: int) -> str | None:
+        """Normalized title of an indexed product."""
+        return self._titles.get(product_id)
+
+    def _candidates(self, pattern: str):
+        if len(pattern) < _GRAM:
+            return self._titles.keys()
+        postings = []
+        for gram in _trigrams(pattern):
+            posting = self._postings.get(gram)
+            if not posting:
+                return ()
+            postings.append(posting)
+        postings.sort(key=len)
+        return set.intersection(*postings)
+
+    def search(self, patterns: list[str]) -> list[int]:
+        """Return ids whose title contains any normalized pattern, best first.
+
+        Ranking: exact title, then prefix, then earliest match position, then
+        shorter titles; ties are broken by id.
+        """
+        best: dict[int, tuple] = {}
+        for pattern in patterns:
+            if not pattern:
+                continue
+            for product_id in self._candidates(pattern):
+                title = self._titles[product_id]
+                position = title.find(pattern)
+                if position < 0:
+                    continue
+                key = (
+                    0 if title == pattern else 1 if position == 0 else 2,
+                    position,
+                    len(title),
+                    product_id,
+                )
+                current = best.get(product_id)
+                if current is None or key < current:
+                    best[product_id] = key
+        return sorted(best, key=best.__getitem__)
+
+    def search_words(self, patterns: list[str]) -> list[int]:
+        """Return ids whose title words spell out any pattern, best first.
+
+        Patterns are compared with runs of consecutive ``search_tokens`` of
+        the title, so they only match on word boundaries.  Ranked like
+        ``search``, with positions counted in the joined title words.
+        """
+        best: dict[int, tuple] = {}
+        for pattern in patterns:
+            if not pattern:
+                continue
+            # a matching title has a word that starts the pattern
+            candidates: set[int] = set()
+            for end in range(1, len(pattern) + 1):
+                candidates.update(self._word_products.get(pattern[:end], ()))
+            for product_id in candidates:
+                words = self._title_words[product_id]
+                position = _word_run_start(words, pattern)
+                if position < 0:
+                    continue
+                length = sum(map(len, words))
+                key = (
+                    0 if length == len(pattern) else 1 if position == 0 else 2,
+                    position,
+                    len(self._titles[product_id]),
+                    product_id,
+                )
+                current = best.get(product_id)
+                if current is None or key < current:
+                    best[product_id] = key
+        return sorted(best, key=best.__getitem__)
+
+    def search_term(self, search_norm: str) -> list[int]:
+        """Ranked ids for a normalized search term, expanding search aliases.
+
+        An alias term matches the words of its whole group
+        (``search_words``); any other term is a title substring (``search``).
+        """
+        group = resolve_alias(search_norm)
+        if group is not None:
+            return self.search_words(list(group.patterns))
+        return self.search([search_norm])
+
+    def _similar_words(self, word: str) -> dict[str, int]:
+        """Indexed words within ``_max_edits(word)`` of ``word`` -> distance."""
+        edits = _max_edits(word)
+        if edits == 0:
+            return {word: 0} if word in self._word_products else {}
+        grams = _bigrams(word)
+        shared: Counter[str] = Counter()
+        for gram in grams:
+            shared.update(self._word_postings.get(gram, ()))
+        needed = len(grams) - 2 * edits
+        matches = {}
+        for candidate, count in shared.items():
+            if count < needed:
+                continue
+            distance = _bounded_levenshtein(word, candidate, edits)
+            if distance <= edits:
+                matches[candidate] = distance
+        return matches
+
+    def fuzzy_search(self, text: str) -> list[int]:
+        """Ids whose title has a close match for every word of ``text``, best first.
+
+        Words shorter than ``SEARCH_FUZZY_MIN_WORD_LENGTH`` must match
+        exactly; longer ones may be one edit away, or two from
+        ``SEARCH_FUZZY_TWO_EDITS_LENGTH`` characters.  Ranking: total edit
+        distance, then shorter titles, then id.
+        """
+        distances: dict[int, int] | None = None
+        for word in dict.fromkeys(search_tokens(text)):
+            word_distances: dict[int, int] = {}
+            for match, distance in self._similar_words(word).items():
+                for product_id in self._word_products[match]:
+                    if distance < word_distances.get(product_id, distance + 1):
+                        word_distances[product_id] = distance
+            if distances is None:
+                distances = word_distances
+            else:
+                distances = {
+                    product_id: total + word_distances[product_id]
+                    for product_id, total in distances.items()
+                    if product_id in word_distances
+                }
+            if not distances:
+                return []
+        if not distances:
+            return []
+        return sorted(
+            distances,
+            key=lambda product_id: (distances[product_id], len(self._titles[product_id]), product_id),
+        )
+
+    def similarity(self, product_id: int, text: str) -> float:
+        """Trigram (Jaccard) similarity between an indexed title and ``text``."""
+        title_grams = _trigrams(self._titles.get(product_id, ""))
+        text_grams = _trigrams(normalize_search_text(text))
+        union = title_grams | text_grams
+        return len(title_grams & text_grams) / len(union) if union else 0.0
+
+
+title_index = TitleSearchIndex()
+
+_refreshed_at: float | None = None
+_modified_since: date | None = None
+_refresh_lock = asyncio.Lock()
+
+
+async def _rebuild(session: AsyncSession) -> None:
+    result = await session.execute(select(Product.id_product, Product.title))
+    title_index.clear()
+    for product_id, title in result.all():
+        title_index.add(product_id, title)
+
+
+async def refresh_title_index(session: AsyncSession, force: bool = False) -> TitleSearchIndex:
+    """Bring the index up to date, incrementally when possible."""
+    global _refreshed_at, _modified_since
+
+    async with _refresh_lock:
+        if (
+            not force
+            and _refreshed_at is not None
+            and time.monotonic() - _refreshed_at < SEARCH_INDEX_REFRESH_SECONDS
+        ):
+            return title_index
+
+        # date_last_modified has day granularity; keep a one-day margin so
+        # edits made around midnight (or in another timezone) are not missed.
+        started_on = date.today() - timedelta(days=1)
+
+        if force or _modified_since is None:
+            await _rebuild(session)
+        else:
+            result = await session.execute(
+                select(Product.id_product, Product.title).where(
+                    or_(
+                        Product.id_product > title_index.max_id,
+                        Product.date_last_modified >= _modified_since,
+                    )
+                )
+            )
+            for product_id, title in result.all():
+                title_index.add(product_id, title)
+
+            total = await session.execute(select(func.count(Product.id_product)))
+            if (total.scalar() or 0) != len(title_index):
+                await _rebuild(session)
+
+        _modified_since = started_on
+        _refreshed_at = time.monotonic()
+        return title_index
+
+
+async def search_product_ids(session: AsyncSession, search_norm: str) -> list[int]:
+    """Ranked ids of products matching a normalized (alias-aware) search term."""
+    index = await refresh_title_index(session)
+    return index.search_term(search_norm)
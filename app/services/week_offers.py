@@ -0,0 +1,187 @@
+"""Cached week-offers feed for ``GET /products/week-offers``.
+
+A product is on offer when one of its GameDetail variants is attached
+(``coupons_coupon_game_details``) to a coupon that:
+
+  * has ``percentage_off > 0`` and ``is_valid``;
+  * has not expired yet;
+  * was created in the last ``WEEK_OFFERS_WINDOW_DAYS`` days.
+
+``get_week_offers_feed`` returns the whole feed (newest coupon first) with
+the discounted prices already computed.  The feed is built once per worker
+and kept until the first of:
+
+  * one of its coupons expires or falls out of the window;
+  * a coupon is created or modified (detected with a cheap aggregate over
+    ``coupons_coupon``, checked at most every
+    ``WEEK_OFFERS_VERSION_TTL_SECONDS``);
+  * ``WEEK_OFFERS_MAX_AGE_SECONDS`` elapse (picks up price edits).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+
+from app.models import Coupon, CouponGameDetail, GameDetail, Product
+from app.repositories.products import ProductRepository
+from app.services.coupon_directory import get_coupon_version
+
+WEEK_OFFERS_WINDOW_DAYS = int(os.getenv("WEEK_OFFERS_WINDOW_DAYS", "7"))
+WEEK_OFFERS_VERSION_TTL_SECONDS = float(os.getenv("WEEK_OFFERS_VERSION_TTL_SECONDS", "5"))
+WEEK_OFFERS_MAX_AGE_SECONDS = float(os.getenv("WEEK_OFFERS_MAX_AGE_SECONDS", "300"))
+
+
+@dataclass
+class WeekOffersFeed:
+    data: list[dict]
+    version: tuple
+    built_at: float
+    expires_at: datetime
+    checked_at: float
+
+
+_feed: WeekOffersFeed | None = None
+_build_lock = asyncio.Lock()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _discounted(price: int, percentage_off: int) -> float:
+    return round(price * (100 - percentage_off) / 100.0, 2)
+
+
+async def _build_feed(session: AsyncSession) -> WeekOffersFeed:
+    version = await get_coupon_version(session)
+    now = _utcnow()
+    window = timedelta(days=WEEK_OFFERS_WINDOW_DAYS)
+
+    result = await session.execute(
+        select(
+            GameDetail.producto_id,
+            GameDetail.precio,
+            Coupon.id_coupon,
+            Coupon.percentage_off,
+            Coupon.created_at,
+            Coupon.expiration_date,
+        )
+        .join(CouponGameDetail, CouponGameDetail.coupon_id == Coupon.id_coupon)
+        .join(GameDetail, GameDetail.id_game_detail == CouponGameDetail.gamedetail_id)
+        .where(
+            Coupon.percentage_off > 0,
+            Coupon.is_valid.is_(True),
+            Coupon.expiration_date > now,
+            Coupon.created_at >= now - window,
+            GameDetail.producto_id.is_not(None),
+            GameDetail.precio > 0,
+        )
+    )
+
+    # product_id -> best offer for that product
+    offers: dict[int, dict] = {}
+    expires_at = now + timedelta(seconds=WEEK_OFFERS_MAX_AGE_SECONDS)
+    for row in result.all():
+        created_at = _as_utc(row.created_at)
+        expires_at = min(expires_at, _as_utc(row.expiration_date), created_at + window)
+
+        offer_price = _discounted(row.precio, row.percentage_off)
+        offer = offers.get(row.producto_id)
+        if offer is None:
+            offers[row.producto_id] = {
+                "created_at": created_at,
+                "coupon_id": row.id_coupon,
+                "percentage_off": row.percentage_off,
+                "offer_price": offer_price,
+                "offer_expires_at": _as_utc(row.expiration_date),
+            }
+            continue
+        offer["created_at"] = max(offer["created_at"], created_at)
+        if offer_price < offer["offer_price"]:
+            offer.update(
+                coupon_id=row.id_coupon,
+                percentage_off=row.percentage_off,
+                offer_price=offer_price,
+                offer_expires_at=_as_utc(row.expiration_date),
+            )
+
+    product_ids = sorted(offers, key=lambda pid: (offers[pid]["created_at"], -pid), reverse=True)
+    products_result = await session.execute(
+        select(Product)
+        .options(noload(Product.consoles))
+        .where(Product.id_product.in_(product_ids))
+    )
+    products = {p.id_product: p for p in products_result.scalars().all()}
+    prices = await ProductRepository.get_price_summaries(session, list(products))
+
+    data = [
+        {
+            "id_product": p.id_product,
+            "title": p.title,
+            "description": p.description,
+            "date_register": p.date_register,
+            "date_last_modified": p.date_last_modified,
+            "image": p.image,
+            "calification": p.calification,
+            "puntos_venta": p.puntos_venta,
+            "puede_rentarse": p.puede_rentarse,
+            "destacado": p.destacado,
+            "type_id_id": p.type_id_id,
+            "tipo_juego_id": p.tipo_juego_id,
+            "price": prices[p.id_product].min_price,
+            "price_discount": prices[p.id_product].min_discount_price,
+            "coupon_id": offers[p.id_product]["coupon_id"],
+            "percentage_off": offers[p.id_product]["percentage_off"],
+            "offer_price": offers[p.id_product]["offer_price"],
+            "offer_expires_at": offers[p.id_product]["offer_expires_at"],
+        }
+        for p in (products[pid] for pid in product_ids if pid in products)
+    ]
+
+    built_at = time.monotonic()
+    return WeekOffersFeed(
+        data=data,
+        version=version,
+        built_at=built_at,
+        expires_at=expires_at,
+        checked_at=built_at,
+    )
+
+
+async def _is_current(session: AsyncSession, feed: WeekOffersFeed | None) -> bool:
+    if feed is None or _utcnow() >= feed.expires_at:
+        return False
+    if time.monotonic() - feed.checked_at < WEEK_OFFERS_VERSION_TTL_SECONDS:
+        return True
+    if await get_coupon_version(session) != feed.version:
+        return False
+    feed.checked_at = time.monotonic()
+    return True
+
+
+async def get_week_offers_feed(session: AsyncSession) -> list[dict]:
+    """The current week-offers feed, newest coupon first."""
+    global _feed
+
+    feed = _feed
+    if await _is_current(session, feed):
+        return feed.data
+
+    async with _build_lock:
+        feed = _feed
+        if await _is_current(session, feed):
+            return feed.data
+        feed = _feed = await _build_feed(session)
+        return feed.data
@@ -0,0 +1,32 @@
+"""Run in-process side effects only once a session's transaction commits.
+
+Services add their changes to a session without committing; caches and
+counters that mirror those changes must not be touched until the caller
+actually commits.  ``call_after_commit`` registers a callback under a key
+(registering the same key twice keeps a single callback); callbacks run after
+COMMIT and are discarded on ROLLBACK.
+"""
+
+from collections.abc import Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+_CALLBACKS_KEY = "after_commit_callbacks"
+
+
+def call_after_commit(session: AsyncSession | Session, key: str, callback: Callable[[], None]) -> None:
+    """Run ``callback`` after ``session`` commits its current transaction."""
+    session.info.setdefault(_CALLBACKS_KEY, {})[key] = callback
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for callback in session.info.pop(_CALLBACKS_KEY, {}).values():
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_CALLBACKS_KEY, None)
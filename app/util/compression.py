@@ -0,0 +1,154 @@
+"""Negotiated gzip / brotli response compression.
+
+Compression is opt-in per route: endpoints declare
+``dependencies=[Depends(enable_compression)]`` and ``CompressionMiddleware``
+then encodes their responses when the client accepts it and the body is at
+least ``COMPRESSION_MINIMUM_SIZE`` bytes.  Responses that already carry a
+``Content-Encoding`` (e.g. the pre-compressed catalog snapshot) and streaming
+responses (no ``Content-Length``) are passed through untouched.
+
+Brotli (``brotli`` in requirements.txt) is used when the client prefers
+it; gzip is always available.  If ``brotli`` is missing from an environment
+the app still starts and negotiation falls back to gzip.  Encoded responses
+get a weak ETag (their bytes differ from the identity representation) and
+``Vary: Accept-Encoding``.
+
+Bodies of at least ``COMPRESSION_THREAD_MIN_SIZE`` bytes are compressed in
+a worker thread (``compress_async``) so large responses do not stall the
+event loop; smaller ones are cheaper to compress inline.
+"""
+
+import asyncio
+import gzip
+import os
+
+from fastapi import Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # listed in requirements.txt; gzip-only without it
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", "65536"))
+
+_STATE_KEY = "compress_response"
+
+
+def supported_encodings() -> tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Best supported encoding for an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+
+async def compress_async(body: bytes, encoding: str) -> bytes:
+    """``compress``, in a worker thread for bodies of ``COMPRESSION_THREAD_MIN_SIZE`` or more."""
+    if len(body) >= COMPRESSION_THREAD_MIN_SIZE:
+        return await asyncio.to_thread(compress, body, encoding)
+    return compress(body, encoding)
+
+
+def weaken_etag(etag: str) -> str:
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+def enable_compression(request: Request) -> None:
+    """Route dependency that opts the response into compression."""
+    setattr(request.state, _STATE_KEY, True)
+
+
+def _add_vary(headers: MutableHeaders) -> None:
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = vary + ", Accept-Encoding"
+
+
+class CompressionMiddleware:
+    """Compress opted-in responses (see ``enable_compression``)."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        start: Message | None = None
+        chunks: list[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            opted_in = scope.get("state", {}).get(_STATE_KEY, False)
+            # Streaming responses (no Content-Length) are never buffered.
+            if not opted_in or "content-encoding" in headers or "content-length" not in headers:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            _add_vary(headers)
+            if encoding is not None and len(body) >= self.minimum_size:
+                body = await compress_async(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                if "etag" in headers:
+                    headers["ETag"] = weaken_etag(headers["etag"])
+            await send(start)
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
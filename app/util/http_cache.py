@@ -0,0 +1,38 @@
+"""Helpers for conditional GET (ETag / If-None-Match)."""
+
+import hashlib
+
+from fastapi import HTTPException, Request, status
+
+
+def make_etag(version: str, request: Request) -> str:
+    """Strong ETag for ``request``'s representation at a given data ``version``.
+
+    The path and query string are part of the tag so that different
+    listings of the same catalog version never share an ETag.
+    """
+    raw = f"{version}|{request.url.path}?{request.url.query}"
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match header matches ``etag``.
+
+    Uses the weak comparison required for If-None-Match (RFC 9110 13.1.2).
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in tags
+
+
+def raise_if_not_modified(request: Request, etag: str) -> None:
+    """Short-circuit the request with a bodiless 304 when the ETag matches."""
+    if etag_matches(request, etag):
+        raise HTTPException(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": "no-cache"},
+        )
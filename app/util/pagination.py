@@ -0,0 +1,55 @@
+"""Opaque cursor tokens for keyset pagination.
+
+A cursor encodes the sort key of the last row of a page, e.g.
+``(date_register, id_product)``, as URL-safe base64 JSON.  Endpoints decode it
+back with the expected key types and translate it into a WHERE clause, so
+deep pages cost the same as the first one.
+"""
+
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from fastapi import HTTPException, status
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(value, type_):
+    if value is None:
+        return None
+    if type_ is datetime:
+        return datetime.fromisoformat(value)
+    if type_ is date:
+        return date.fromisoformat(value)
+    return type_(value)
+
+
+def encode_cursor(*values) -> str:
+    """Encode a sort key tuple into an opaque cursor token."""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """Decode a cursor produced by ``encode_cursor`` into typed values.
+
+    Raises:
+        HTTPException 400: the token is malformed or does not match ``types``.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("cursor arity mismatch")
+        return tuple(_decode_value(v, t) for v, t in zip(values, types))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor.",
+        )
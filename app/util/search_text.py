@@ -0,0 +1,19 @@
+import re
+
+from unidecode import unidecode
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_search_text(value: str) -> str:
+    """Normalize text for title matching: ASCII-fold, lowercase, drop spaces.
+
+    Mirrors the SQL expression ``replace(unaccent(lower(title)), ' ', '')``
+    used by the product search endpoints.
+    """
+    return unidecode(value or "").lower().replace(' ', '')
+
+
+def search_tokens(value: str) -> list[str]:
+    """ASCII-folded, lowercase alphanumeric words of ``value`` (for fuzzy matching)."""
+    return _WORD.findall(unidecode(value or "").lower())
@@ -111,9 +111,8 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    from sqlalchemy import select
-    result = await session.execute(select(User).filter(User.username == username))
-    user = result.scalars().first()
+    from app.repositories.auth import get_user_by_username
+    user = await get_user_by_username(session, username)
     if user is None:
         raise credentials_exception
     return user